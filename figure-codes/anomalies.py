@@ -0,0 +1,125 @@
+import numpy as np
+import xarray as xr
+
+
+def monthly_aggregates(da):
+    """Reduce a daily field to monthly sums and valid-day counts in one pass
+
+    Sums and counts (rather than means) keep every later weighting exact: annual
+    means, baselines over any reference period and anomalies all follow from these
+    without touching daily data again.
+
+    Args:
+        da (xarray DataArray): daily data
+
+    Returns:
+        xarray dataset: 'sum' and 'count' on (year, month, ...)
+    """
+    agg = xr.Dataset(dict(
+        sum=da.resample(time='MS').sum('time'),
+        count=da.notnull().resample(time='MS').sum('time'),
+    ))
+    year = agg.time.dt.year.values
+    month = agg.time.dt.month.values
+    agg = agg.assign_coords(year=('time', year), month=('time', month))
+    # unstack appends (year, month) last; put them where time was
+    order = [d for dim in da.dims for d in (('year', 'month') if dim == 'time' else (dim,))]
+    return agg.set_index(time=['year', 'month']).unstack('time').transpose(*order)
+
+
+def from_reduced(reduced, var):
+    """Monthly aggregates from a ``member_reducer`` output (monthly mean and day counts)"""
+    count = reduced[f'{var}_ndays']
+    return xr.Dataset(dict(sum=(reduced[f'{var}_monthly_mean'] * count).fillna(0), count=count))
+
+
+def _mean(agg, dims):
+    return agg['sum'].sum(dims) / agg['count'].sum(dims)
+
+
+class AnomalyEngine:
+    """Anomalies against any reference period, computed from monthly aggregates
+
+    Baselines are cached per reference period, so switching between e.g. 1978-2014
+    and the full scenario is a cheap subtraction on yearly/monthly data.
+    """
+
+    def __init__(self, agg):
+        self.agg = agg
+        self._baselines = dict()
+
+    @classmethod
+    def from_daily(cls, da, persist=True):
+        """Build from daily data; the only pass over the daily series
+
+        Args:
+            da (xarray DataArray): daily data
+            persist (bool, optional): Whether to persist the aggregates (in cluster memory if a client is active). Defaults to True.
+
+        Returns:
+            AnomalyEngine: engine over the aggregates
+        """
+        agg = monthly_aggregates(da)
+        if persist:
+            agg = agg.persist()
+        return cls(agg)
+
+    def yearly(self):
+        """Day-weighted annual means"""
+        return _mean(self.agg, 'month')
+
+    def monthly(self):
+        """Monthly means on (year, month)"""
+        return self.agg['sum'] / self.agg['count']
+
+    def baseline(self, period=None, seasonal_cycle=False):
+        """Mean over a reference period of years, cached
+
+        Args:
+            period (tuple, optional): (first year, last year), inclusive. Defaults to None (whole record).
+            seasonal_cycle (bool, optional): Whether to return one baseline per calendar month. Defaults to False.
+
+        Returns:
+            xarray DataArray: baseline without the year (and month) dimension
+        """
+        key = (period, seasonal_cycle)
+        if key not in self._baselines:
+            agg = self.agg if period is None else self.agg.sel(year=slice(int(period[0]), int(period[1])))
+            dims = 'year' if seasonal_cycle else ['year', 'month']
+            self._baselines[key] = _mean(agg, dims).persist()
+        return self._baselines[key]
+
+    def anomaly(self, period=None, freq='year', seasonal_cycle=False):
+        """Anomalies relative to a reference period
+
+        ``anomaly()`` equals ``(da - da.mean('time')).resample(time='1Y').mean('time')``
+        as in ``subset_ds(task='anomaly')`` and ``extractWindAnomaly``, and
+        ``anomaly((1978, 2014))`` is the baseline of the ``forcings`` dictionaries.
+
+        Args:
+            period (tuple, optional): (first year, last year) of the reference period. Defaults to None (whole record).
+            freq (str, optional): 'year' or 'month'. Defaults to 'year'.
+            seasonal_cycle (bool, optional): Whether monthly anomalies remove a per-month baseline. Defaults to False.
+
+        Returns:
+            xarray DataArray: anomalies on 'year' or ('year', 'month')
+        """
+        if freq == 'year':
+            return self.yearly() - self.baseline(period)
+        if freq == 'month':
+            return self.monthly() - self.baseline(period, seasonal_cycle=seasonal_cycle)
+        raise ValueError(f'Unknown anomaly frequency: {freq}')
+
+
+def to_time(da):
+    """Put (year[, month]) back on a datetime 'time' axis for the figure functions
+
+    'time' takes the position of 'year', e.g. (year, month, lat, lon) -> (time, lat, lon).
+    """
+    order = [('time' if d == 'year' else d) for d in da.dims if d != 'month']
+    if 'month' in da.dims:
+        stacked = da.stack(time=['year', 'month'])
+        times = [np.datetime64(f'{y:04d}-{m:02d}-01') for y, m in stacked.time.values]
+        return stacked.drop_vars(['time', 'year', 'month']).assign_coords(time=times).transpose(*order)
+    times = [np.datetime64(f'{y:04d}-12-31') for y in da.year.values]
+    return da.rename(year='time').assign_coords(time=times).transpose(*order)
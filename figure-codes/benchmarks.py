@@ -0,0 +1,323 @@
+"""Benchmark the pipeline hot paths on synthetic CESM-shaped data
+
+Usage (from the repository root):
+
+    python figure-codes/benchmarks.py --members 3 --years 20
+    python figure-codes/benchmarks.py --only trend gev --baseline last --tolerance 0.2
+    python figure-codes/benchmarks.py --time-chunk auto --backend threads --workers 8
+
+Every run appends one JSON line (timings, peak memory, configuration, git commit)
+to the history file; with ``--baseline`` the run is compared against an earlier
+record and the exit status is 1 if any case regressed.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+HISTORY = os.path.join('logs', 'benchmark_history.jsonl')
+
+
+def _wind_block(location, cycle, trend, seed):
+    """One (realization, time, lat, lon) block, seeded by its position so any chunking is reproducible"""
+    (m0, m1), (t0, t1), (y0, y1), (x0, x1) = location
+    rng = np.random.default_rng([seed, m0, t0, y0, x0])
+    values = rng.weibull(2.0, size=(m1 - m0, t1 - t0, y1 - y0, x1 - x0))
+    values *= 6 * cycle[t0:t1] * trend[t0:t1]
+    return values.astype('float32')
+
+
+def synthetic_wind(nlat=192, nlon=288, members=3, years=10, freq='D', start=2015, seed=0, chunks=None):
+    """Weibull-distributed wind speeds with a seasonal cycle and a small trend
+
+    Values are generated block by block: with ``chunks`` the array stays lazy and
+    each dask block is drawn only when computed, otherwise a float32 array is filled
+    one member-year at a time, so building the fixture never needs a float64 copy
+    of the whole field.
+
+    Args:
+        nlat (int, optional): number of latitudes (CESM2 f09: 192). Defaults to 192.
+        nlon (int, optional): number of longitudes (CESM2 f09: 288). Defaults to 288.
+        members (int, optional): number of realizations. Defaults to 3.
+        years (int, optional): number of years. Defaults to 10.
+        freq (str, optional): 'D' (daily) or 'MS' (monthly). Defaults to 'D'.
+        start (int, optional): first year. Defaults to 2015.
+        seed (int, optional): random seed. Defaults to 0.
+        chunks (dict, optional): dask chunks, None for numpy. Defaults to None.
+
+    Returns:
+        xarray DataArray: 'WSPDSRFAV' on (realization, time, lat, lon)
+    """
+    time_index = pd.date_range(f'{start}-01-01', f'{start + years - 1}-12-31', freq=freq)
+    lat = np.linspace(-90, 90, nlat)
+    lon = np.linspace(0, 360, nlon, endpoint=False)
+    day = time_index.dayofyear.values
+    cycle = 1 + 0.2 * np.cos(2 * np.pi * (day - 15) / 365)[:, None, None]
+    trend = 1 + 0.002 * (time_index.year.values - start)[:, None, None]
+    dims = ('realization', 'time', 'lat', 'lon')
+    shape = (members, len(time_index), nlat, nlon)
+    if chunks:
+        import dask.array as dsa
+
+        def block(block_info=None):
+            return _wind_block(block_info[None]['array-location'], cycle, trend, seed)
+
+        sizes = tuple(chunks.get(d, -1) for d in dims)
+        values = dsa.map_blocks(block, chunks=dsa.core.normalize_chunks(sizes, shape), dtype='float32',
+                                meta=np.array((), dtype='float32'))
+    else:
+        values = np.empty(shape, dtype='float32')
+        step = 366 if freq == 'D' else 12
+        for m in range(members):
+            for t in range(0, shape[1], step):
+                t1 = min(t + step, shape[1])
+                values[m, t:t1] = _wind_block(((m, m + 1), (t, t1), (0, nlat), (0, nlon)), cycle, trend, seed)[0]
+    return xr.DataArray(
+        values,
+        dims=dims,
+        coords={'realization': np.arange(members), 'time': time_index, 'lat': lat, 'lon': lon},
+        name='WSPDSRFAV',
+    )
+
+
+def synthetic_regions(n=8, lat=(20, 50), lon=(235, 295)):
+    """A row of box regions over a CONUS-like area (no Natural Earth download)"""
+    import regionmask
+
+    edges = np.linspace(lon[0], lon[1], n + 1)
+    outlines = [np.array([[w, lat[0]], [e, lat[0]], [e, lat[1]], [w, lat[1]]]) for w, e in zip(edges[:-1], edges[1:])]
+    return regionmask.Regions(outlines, names=[f'box{i}' for i in range(n)], abbrevs=[f'b{i}' for i in range(n)], name='synthetic')
+
+
+def season_mean(ds, calendar='standard'):
+    """``season_mean`` exactly as defined in the notebooks"""
+    month_length = ds.time.dt.days_in_month
+    weights = month_length.groupby('time.season') / month_length.groupby('time.season').sum()
+    np.testing.assert_allclose(weights.groupby('time.season').sum().values, np.ones(4))
+    return (ds * weights).groupby('time.season').sum(dim='time').reindex(season=['DJF', 'MAM', 'JJA', 'SON'])
+
+
+def _yearly(da):
+    return da.groupby('time.year').mean('time')
+
+
+def _case_mask_data(data):
+    from region_masks import RegionMaskCache, mask_data
+    return mask_data(data['daily'], data['regions'], None, cache=RegionMaskCache(cache_dir=None))
+
+
+def _case_regional_means(data):
+    from region_aggregation import RegionAggregator
+    daily = data['daily']
+    aggregate = RegionAggregator.from_mask(data['regions'].mask(daily.lon, daily.lat))
+    return aggregate(daily)
+
+
+def _case_anomaly(data):
+    from anomalies import AnomalyEngine
+    engine = AnomalyEngine.from_daily(data['daily'], persist=False)
+    first = int(data['daily'].time.dt.year[0])
+    return engine.anomaly((first, first + 4))
+
+
+def _case_trend(data):
+    from trend_significance import linear_trend
+    return linear_trend(data['yearly'], 'year')
+
+
+def _case_gev(data):
+    from return_levels import return_level_windows
+    years = data['yearly'].year.values
+    return return_level_windows(data['daily'], t=50, windows={'all': (str(years[0]), str(years[-1]))})
+
+
+def _case_season_mean(data):
+    return season_mean(data['monthly'])
+
+
+def _case_station_extraction(data):
+    from station_extract import extract_stations
+    return extract_stations(data['yearly'], data['stations'], 'synthetic', method='bilinear', cache_dir=None)
+
+
+def _case_ensemble_percentiles(data):
+    from ensemble_stats import ensemble_stats
+    yearly = data['yearly']
+    members = (yearly.sel(realization=r, drop=True) for r in yearly.realization.values)
+    return ensemble_stats(members, values=(10, 50, 90))
+
+
+CASES = {
+    'mask_data': _case_mask_data,
+    'regional_means': _case_regional_means,
+    'anomaly': _case_anomaly,
+    'trend': _case_trend,
+    'gev': _case_gev,
+    'season_mean': _case_season_mean,
+    'station_extraction': _case_station_extraction,
+    'ensemble_percentiles': _case_ensemble_percentiles,
+}
+
+
+def _materialize(result):
+    if isinstance(result, tuple):
+        return tuple(_materialize(r) for r in result)
+    return result.compute() if hasattr(result, 'compute') else result
+
+
+def make_inputs(nlat=192, nlon=288, members=3, years=10, stations=500, chunks=None, seed=0):
+    """Synthetic inputs shared by every case (built once, outside the timings)
+
+    With ``chunks`` the daily field stays lazy, so each timed run also draws the
+    blocks it reads; the derived monthly and yearly inputs are computed here.
+    """
+    daily = synthetic_wind(nlat, nlon, members, years, 'D', seed=seed, chunks=chunks)
+    monthly = daily.resample(time='MS').mean()
+    rng = np.random.default_rng(seed)
+    table = pd.DataFrame(dict(
+        station=np.arange(stations),
+        lat=rng.uniform(25, 49, stations),
+        lon=rng.uniform(235, 293, stations),
+    ))
+    return dict(
+        daily=daily,
+        monthly=monthly.compute() if chunks else monthly,
+        yearly=_yearly(daily).compute(),
+        stations=table,
+        regions=synthetic_regions(),
+    )
+
+
+def run_case(func, data, repeat=3):
+    """Best wall time over ``repeat`` untraced runs, then peak memory from one traced run
+
+    Timings are taken without tracemalloc, whose allocation hooks would slow every
+    run down. Peak memory is measured with tracemalloc, which sees numpy buffers on
+    every thread of this process (run with the threaded or synchronous dask scheduler).
+    """
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _materialize(func(data))
+        seconds.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        _materialize(func(data))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'seconds': min(seconds), 'peak_mb': peak / 2**20}
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def find_baseline(history, ref, config):
+    """Latest record with the same configuration, optionally for a given commit ('last' for the newest)"""
+    matching = [r for r in history if r['config'] == config and (ref == 'last' or r['commit'] == ref)]
+    return matching[-1] if matching else None
+
+
+def compare(results, baseline, tolerance=0.2):
+    """Cases whose time or peak memory grew by more than ``tolerance`` (fraction)
+
+    Returns:
+        list: (case, metric, baseline value, new value)
+    """
+    regressions = []
+    for case, new in results.items():
+        old = baseline['results'].get(case)
+        if old is None:
+            continue
+        for metric in ('seconds', 'peak_mb'):
+            if new[metric] > old[metric] * (1 + tolerance):
+                regressions.append((case, metric, old[metric], new[metric]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the wind-trend pipeline on synthetic data')
+    parser.add_argument('--nlat', type=int, default=192)
+    parser.add_argument('--nlon', type=int, default=288)
+    parser.add_argument('--members', type=int, default=3)
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--stations', type=int, default=500)
+    parser.add_argument('--time-chunk', default=None,
+                        help="dask time chunk, 'auto' to size it from the execution backend, none for in-memory numpy")
+    parser.add_argument('--backend', choices=('threads', 'sync'), default='threads',
+                        help='local dask scheduler (tracemalloc only sees this process)')
+    parser.add_argument('--workers', type=int, default=None, help='scheduler threads. Defaults to the CPU count.')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', nargs='*', choices=list(CASES), help='run only these cases')
+    parser.add_argument('--history', default=HISTORY, help='JSON lines history file')
+    parser.add_argument('--baseline', help="commit to compare against, or 'last'")
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown/memory growth')
+    parser.add_argument('--no-record', action='store_true', help='do not append this run to the history')
+    args = parser.parse_args(argv)
+    from execution import Execution, ExecutionConfig
+
+    results = dict()
+    with Execution(ExecutionConfig(backend=args.backend, workers=args.workers)) as ex:
+        time_chunk = args.time_chunk
+        if time_chunk == 'auto':
+            sizes = {'realization': args.members, 'time': 365 * args.years, 'lat': args.nlat, 'lon': args.nlon}
+            time_chunk = ex.chunks(sizes, itemsize=4)['time']
+        time_chunk = int(time_chunk) if time_chunk else None
+        config = dict(nlat=args.nlat, nlon=args.nlon, members=args.members, years=args.years,
+                      stations=args.stations, time_chunk=time_chunk,
+                      backend=ex.config.backend, workers=ex.config.workers)
+        chunks = {'time': time_chunk, 'realization': 1} if time_chunk else None
+        data = make_inputs(args.nlat, args.nlon, args.members, args.years, args.stations, chunks)
+        for name, func in CASES.items():
+            if args.only and name not in args.only:
+                continue
+            results[name] = run_case(func, data, args.repeat)
+            print(f"{name:<22} {results[name]['seconds']:8.3f}s {results[name]['peak_mb']:9.1f} MB")
+
+    history = load_history(args.history)
+    record = dict(
+        timestamp=datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        commit=_git_commit(),
+        config=config,
+        results=results,
+    )
+    status = 0
+    if args.baseline:
+        baseline = find_baseline(history, args.baseline, config)
+        if baseline is None:
+            print(f'No baseline {args.baseline} with this configuration', file=sys.stderr)
+        else:
+            for case, metric, old, new in compare(results, baseline, args.tolerance):
+                print(f'REGRESSION {case} {metric}: {old:.3f} -> {new:.3f}', file=sys.stderr)
+                status = 1
+    if not args.no_record:
+        os.makedirs(os.path.dirname(args.history) or '.', exist_ok=True)
+        with open(args.history, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+    return status
+
+
+if __name__ == '__main__':
+    # Pipeline modules are imported by name, so make sure this directory is importable
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    sys.exit(main())
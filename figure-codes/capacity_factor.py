@@ -0,0 +1,146 @@
+from dataclasses import dataclass
+
+import numpy as np
+import xarray as xr
+
+from anomalies import monthly_aggregates
+from climatology_cube import MONTH_SEASON, SEASONS
+
+# CESM2 WSPDSRFAV/sfcWind are 10 m winds
+REFERENCE_HEIGHT = 10
+HUB_HEIGHT = 100
+# 1/7 power law for neutral stability over open land
+SHEAR_EXPONENT = 1 / 7
+ROUGHNESS_LENGTH = 0.03
+
+
+def hub_height_speed(ws, hub_height=HUB_HEIGHT, reference_height=REFERENCE_HEIGHT, profile='power',
+                     alpha=SHEAR_EXPONENT, z0=ROUGHNESS_LENGTH):
+    """Extrapolate near-surface wind speed to hub height
+
+    Args:
+        ws (xarray DataArray or numpy array): wind speed at ``reference_height`` (m/s)
+        hub_height (float, optional): hub height (m). Defaults to HUB_HEIGHT.
+        reference_height (float, optional): height of ``ws`` (m). Defaults to REFERENCE_HEIGHT.
+        profile (str, optional): 'power' (power law) or 'log' (logarithmic profile). Defaults to 'power'.
+        alpha (float, optional): shear exponent of the power law. Defaults to SHEAR_EXPONENT.
+        z0 (float, optional): roughness length of the log profile (m). Defaults to ROUGHNESS_LENGTH.
+
+    Returns:
+        same type as ``ws``: wind speed at hub height
+    """
+    if profile == 'power':
+        factor = (hub_height / reference_height) ** alpha
+    elif profile == 'log':
+        factor = np.log(hub_height / z0) / np.log(reference_height / z0)
+    else:
+        raise ValueError(f'Unknown wind profile: {profile}')
+    return ws * factor
+
+
+@dataclass
+class PowerCurve:
+    """Tabulated turbine power curve normalized to rated power
+
+    Speeds are looked up in a precomputed table at ``resolution`` m/s, which turns
+    the curve into one integer index and one gather per value.
+    """
+
+    speeds: np.ndarray  # m/s, increasing
+    power: np.ndarray  # fraction of rated power
+    cut_out: float = 25.0
+    resolution: float = 0.01
+
+    def __post_init__(self):
+        self.speeds = np.asarray(self.speeds, dtype=float)
+        self.power = np.asarray(self.power, dtype=float)
+        grid = np.arange(0, self.cut_out + self.resolution, self.resolution)
+        self.table = np.interp(grid, self.speeds, self.power, left=0, right=self.power[-1])
+        self.table[grid >= self.cut_out] = 0
+        self.table = self.table.astype('float32')
+
+    @classmethod
+    def from_table(cls, speeds, power, rated_power=None, **kwargs):
+        """Curve from manufacturer tables, e.g. power in kW (normalized by ``rated_power`` or its maximum)"""
+        power = np.asarray(power, dtype=float)
+        return cls(speeds, power / (power.max() if rated_power is None else rated_power), **kwargs)
+
+    @classmethod
+    def generic(cls, cut_in=3.0, rated=11.5, cut_out=25.0):
+        """Generic utility-scale curve: cubic between cut-in and rated speed"""
+        speeds = np.linspace(cut_in, rated, 50)
+        power = (speeds**3 - cut_in**3) / (rated**3 - cut_in**3)
+        return cls(np.r_[0, speeds, cut_out], np.r_[0, power, 1], cut_out=cut_out)
+
+    def __call__(self, speed):
+        """Fraction of rated power for wind speeds (numpy array, NaN preserved)"""
+        speed = np.asarray(speed)
+        index = np.rint(np.where(np.isfinite(speed), speed, 0) / self.resolution).astype(np.int64)
+        out = self.table[np.clip(index, 0, len(self.table) - 1)]
+        out = np.where(index >= len(self.table), 0, out)
+        return np.where(np.isfinite(speed), out, np.nan).astype('float32')
+
+
+def daily_capacity_factor(ws, curve=None, **profile):
+    """Lazy per-cell power output as a fraction of rated power
+
+    Args:
+        ws (xarray DataArray): near-surface wind speed, may be dask-backed
+        curve (PowerCurve, optional): turbine curve. Defaults to ``PowerCurve.generic()``.
+        **profile: keyword arguments of ``hub_height_speed``
+
+    Returns:
+        xarray DataArray: capacity factor with the dims of ``ws``
+    """
+    curve = PowerCurve.generic() if curve is None else curve
+    hub = hub_height_speed(ws, **profile)
+    cf = xr.apply_ufunc(curve, hub, dask='parallelized', output_dtypes=['float32'])
+    return cf.rename('capacity_factor')
+
+
+def capacity_factors(ws, curve=None, aggregator=None, **profile):
+    """Annual and seasonal capacity factors per cell (and per region)
+
+    Daily output is reduced to monthly sums and counts inside the same dask graph,
+    so it is never held in memory; annual and seasonal values follow from those
+    with exact day weighting (December in the DJF of its own year, as ``season_mean``).
+
+    Args:
+        ws (xarray DataArray): daily near-surface wind speed (time, ..., lat, lon)
+        curve (PowerCurve, optional): turbine curve. Defaults to ``PowerCurve.generic()``.
+        aggregator (RegionAggregator, optional): e.g. balancing authorities; adds regional
+            variables on a 'region' dimension. Defaults to None.
+        **profile: keyword arguments of ``hub_height_speed``
+
+    Returns:
+        xarray dataset: 'annual' (year, ...) and 'seasonal' (year, season, ...), plus
+        'annual_region'/'seasonal_region' when an aggregator is given
+    """
+    agg = monthly_aggregates(daily_capacity_factor(ws, curve, **profile))
+    season = MONTH_SEASON.rename('season')
+    by_season = agg.groupby(season).sum('month').reindex(season=SEASONS)
+    out = xr.Dataset(dict(
+        annual=agg['sum'].sum('month') / agg['count'].sum('month'),
+        seasonal=by_season['sum'] / by_season['count'],
+    ))
+    if aggregator is not None:
+        out['annual_region'] = aggregator(out['annual'])
+        out['seasonal_region'] = aggregator(out['seasonal'])
+    return out
+
+
+def ensemble_capacity_factors(forcings, curve=None, aggregator=None, **profile):
+    """``capacity_factors`` for every scenario/forcing, stacked on 'forcing'
+
+    Args:
+        forcings (dict): {forcing: daily wind speed with a member dimension}
+        curve (PowerCurve, optional): turbine curve. Defaults to ``PowerCurve.generic()``.
+        aggregator (RegionAggregator, optional): regional reduction. Defaults to None.
+
+    Returns:
+        xarray dataset: lazy capacity factors; compute or write to persist
+    """
+    return xr.concat(
+        [capacity_factors(ws, curve, aggregator, **profile) for ws in forcings.values()],
+        dim=xr.DataArray(list(forcings), dims='forcing', name='forcing'),
+    )
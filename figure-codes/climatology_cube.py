@@ -0,0 +1,112 @@
+import numpy as np
+import scipy.sparse
+import xarray as xr
+
+from region_aggregation import RegionAggregator, normalize_columns
+
+SEASONS = ['DJF', 'MAM', 'JJA', 'SON']
+MONTH_SEASON = xr.DataArray(
+    ['DJF', 'DJF', 'MAM', 'MAM', 'MAM', 'JJA', 'JJA', 'JJA', 'SON', 'SON', 'SON', 'DJF'],
+    dims='month', coords={'month': np.arange(1, 13)},
+)
+
+
+def _year_month(da):
+    da = da.assign_coords(year=('time', da.time.dt.year.values), month=('time', da.time.dt.month.values))
+    return da.set_index(time=['year', 'month']).unstack('time')
+
+
+class ClimatologyCube:
+    """(forcing, region, window, month|season, realization) climatology cache
+
+    Monthly fields are reduced to regional monthly means once per region (all new
+    regions together in one sparse matmul) and kept with their days-in-month
+    weights. Every seasonal, monthly or decadal view is then a small grouped
+    reduction of that cache: changing the window length never rereads the monthly
+    fields, and adding a region only reduces the new region.
+    """
+
+    def __init__(self, forcings, weights=None):
+        """
+        Args:
+            forcings (dict): {forcing: monthly DataArray with (realization, time, lat, lon)}, e.g. mon_forcings
+            weights (str or None, optional): 'coslat' for area weighted regional means,
+                None for the plain lat/lon mean used in the notebooks. Defaults to None.
+        """
+        self.forcings = forcings
+        self.weights = weights
+        self.series = None  # (forcing, region, realization, year, month)
+        # Days per (year, month) over the union of the forcings' years
+        self.days = None
+        for da in forcings.values():
+            days = _year_month(da.time.dt.days_in_month.astype(float))
+            self.days = days if self.days is None else self.days.combine_first(days)
+
+    def add_regions(self, masks):
+        """Reduce the monthly fields over new regions
+
+        Args:
+            masks (dict): {region name: boolean (lat, lon) DataArray on the forcing grid}
+        """
+        masks = {k: v for k, v in masks.items() if self.series is None or k not in self.series.region.values}
+        if not masks:
+            return self
+        template = next(iter(masks.values())).transpose('lat', 'lon')
+        columns = []
+        for mask in masks.values():
+            inside = mask.transpose('lat', 'lon').values.ravel().astype(float)
+            if self.weights == 'coslat':
+                inside = inside * np.broadcast_to(np.cos(np.deg2rad(template.lat.values))[:, None], template.shape).ravel()
+            columns.append(scipy.sparse.csc_matrix(inside[:, None]))
+        matrix = normalize_columns(scipy.sparse.hstack(columns))
+        aggregate = RegionAggregator(matrix, template.lat, template.lon, list(masks))
+        reduced = xr.concat(
+            [_year_month(aggregate(da)) for da in self.forcings.values()],
+            dim=xr.DataArray(list(self.forcings), dims='forcing', name='forcing'),
+        ).compute()
+        self.series = reduced if self.series is None else xr.concat([self.series, reduced], 'region')
+        return self
+
+    def cube(self, window=10, start=2020, stop=2100, freq='month'):
+        """Day-weighted climatology per window of years
+
+        Windows are non-overlapping [start, start + window) blocks.
+
+        Args:
+            window (int, optional): window length in years. Defaults to 10.
+            start (int, optional): first year of the first window. Defaults to 2020.
+            stop (int, optional): windows end before this year. Defaults to 2100.
+            freq (str, optional): 'month' or 'season'. Defaults to 'month'.
+
+        Returns:
+            xarray DataArray: (forcing, region, window, month|season, realization)
+        """
+        series = self.series.sel(year=slice(start, stop - 1))
+        days = self.days.sel(year=series.year)
+        label = xr.DataArray((series.year.values - start) // window * window + start, dims='year', name='window')
+        valid = series.notnull()
+        total = (series.fillna(0) * days).groupby(label).sum('year')
+        weight = (valid * days).groupby(label).sum('year')
+        if freq == 'season':
+            total = total.groupby(MONTH_SEASON.rename('season')).sum('month').reindex(season=SEASONS)
+            weight = weight.groupby(MONTH_SEASON.rename('season')).sum('month').reindex(season=SEASONS)
+        elif freq != 'month':
+            raise ValueError(f'Unknown climatology frequency: {freq}')
+        cube = total / weight
+        other = 'season' if freq == 'season' else 'month'
+        return cube.transpose('forcing', 'region', 'window', other, 'realization')
+
+    def save(self, path):
+        """Save the regional series cache to netCDF"""
+        xr.Dataset(dict(series=self.series, days=self.days)).to_netcdf(path)
+
+    @classmethod
+    def load(cls, path, forcings=None, weights=None):
+        """Restore a cache written by ``save`` (forcings only needed to add regions)"""
+        ds = xr.open_dataset(path).load()
+        cube = cls.__new__(cls)
+        cube.forcings = forcings
+        cube.weights = weights
+        cube.series = ds.series
+        cube.days = ds.days
+        return cube
@@ -0,0 +1,236 @@
+import numpy as np
+import xarray as xr
+
+
+# Exact member buffers are kept up to this size per variable, then folded into a sketch
+MAX_EXACT_BYTES = 2**30
+SKETCH_BINS = 128
+
+
+class _VariableState:
+    """Welford moments, extrema and percentile state for one variable
+
+    Percentile state is an exact buffer of the members while it fits in
+    ``max_exact_bytes``, otherwise a fixed-range uint16 histogram of ``bins`` bins
+    per cell (2 x ``bins`` bytes per cell).
+    """
+
+    def __init__(self, template, bins, bounds, max_exact_bytes=MAX_EXACT_BYTES):
+        shape = template.shape
+        self.dims = template.dims
+        self.coords = {k: v for k, v in template.coords.items() if set(v.dims) <= set(template.dims)}
+        self.attrs = template.attrs
+        self.count = np.zeros(shape, dtype='int64')
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        self.min = np.full(shape, np.inf)
+        self.max = np.full(shape, -np.inf)
+        self.bounds = bounds
+        self.max_exact_bytes = max_exact_bytes
+        self.sketch_bins = SKETCH_BINS if bins is None else bins
+        self.buffer = []
+        self.edges = self.hist = None
+        if bins is not None:
+            self._to_sketch(self._edges(template.values))
+
+    def _edges(self, values):
+        bounds = self.bounds
+        if bounds is None:
+            # Pad the observed range so later members mostly fall inside
+            finite = values[np.isfinite(values)]
+            lo, hi = (finite.min(), finite.max()) if finite.size else (0.0, 1.0)
+            span = max(hi - lo, 1e-6)
+            bounds = (lo - span, hi + span)
+        return np.linspace(bounds[0], bounds[1], self.sketch_bins + 1)
+
+    def _to_sketch(self, edges):
+        self.edges = edges
+        self.hist = np.zeros((len(edges) - 1,) + self.count.shape, dtype='uint16')
+        for values in self.buffer:
+            self._bin(values)
+        self.buffer = None
+
+    def _bin(self, values):
+        valid = np.isfinite(values)
+        # Values outside the range fall in the edge bins; min/max stay exact
+        b = np.clip(np.searchsorted(self.edges, values, side='right') - 1, 0, len(self.edges) - 2)
+        np.add.at(self.hist, (b[valid],) + np.nonzero(valid), 1)
+
+    @property
+    def exact(self):
+        return self.buffer is not None
+
+    def _check_buffer(self):
+        if self.exact and sum(v.nbytes for v in self.buffer) > self.max_exact_bytes:
+            self._to_sketch(self._edges(np.stack([self.min, self.max])))
+
+    def add(self, values):
+        valid = np.isfinite(values)
+        # Welford update
+        self.count += valid
+        delta = np.where(valid, values - self.mean, 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.mean += np.where(valid, delta / np.maximum(self.count, 1), 0)
+        self.m2 += np.where(valid, delta * (values - self.mean), 0)
+        np.fmin(self.min, values, out=self.min)
+        np.fmax(self.max, values, out=self.max)
+        if self.exact:
+            self.buffer.append(np.array(values))
+            self._check_buffer()
+        else:
+            self._bin(values)
+
+    def merge(self, other):
+        n = self.count + other.count
+        delta = other.mean - self.mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            frac = np.where(n > 0, other.count / np.maximum(n, 1), 0)
+        self.mean = self.mean + delta * frac
+        self.m2 = self.m2 + other.m2 + delta ** 2 * self.count * frac
+        self.count = n
+        np.fmin(self.min, other.min, out=self.min)
+        np.fmax(self.max, other.max, out=self.max)
+        if self.exact and other.exact:
+            self.buffer.extend(other.buffer)
+            self._check_buffer()
+            return
+        if self.exact:
+            self._to_sketch(other.edges)
+        if other.exact:
+            for values in other.buffer:
+                self._bin(values)
+            return
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError('Cannot merge ensemble sketches with different histogram bins')
+        self.hist += other.hist
+
+    def _order_statistic(self, k):
+        """Per-cell k-th smallest member (0-based) located within its histogram bin"""
+        cum = np.cumsum(self.hist, axis=0, dtype='int64')
+        # Bin holding member k: first bin whose cumulative count exceeds k
+        b = np.clip((cum <= k[None]).sum(axis=0), 0, len(self.edges) - 2)
+        below = np.where(b > 0, np.take_along_axis(cum, np.maximum(b - 1, 0)[None], 0)[0], 0)
+        inbin = np.take_along_axis(self.hist, b[None], 0)[0]
+        # The members of a bin are spread evenly across it
+        with np.errstate(invalid='ignore', divide='ignore'):
+            frac = np.clip((k - below + 0.5) / inbin, 0, 1)
+        value = self.edges[b] + frac * (self.edges[b + 1] - self.edges[b])
+        # The extreme order statistics are known exactly
+        value = np.where(k <= 0, self.min, np.where(k >= self.count - 1, self.max, value))
+        return np.clip(value, self.min, self.max)
+
+    def quantile(self, q):
+        """Per-cell quantile with linear interpolation between order statistics (xclim's default)"""
+        if self.exact:
+            with np.errstate(invalid='ignore'):
+                return np.nanquantile(np.stack(self.buffer), q, axis=0)
+        rank = q * np.maximum(self.count - 1, 0)
+        lo = np.floor(rank).astype('int64')
+        hi = np.minimum(lo + 1, np.maximum(self.count - 1, 0))
+        below, above = self._order_statistic(lo), self._order_statistic(hi)
+        value = below + (rank - lo) * (above - below)
+        return np.where(self.count > 0, value, np.nan)
+
+    def to_array(self, values):
+        return xr.DataArray(values, dims=self.dims, coords=self.coords, attrs=self.attrs)
+
+
+class EnsembleAccumulator:
+    """Streaming ensemble statistics, one member at a time
+
+    Keeps mean and variance (Welford), min and max, and percentile state.
+    Results have the same variable names and shapes as
+    ``xclim.ensembles.ensemble_mean_std_max_min`` and
+    ``ensemble_percentiles(..., split=True)``, so plotting code is unchanged.
+
+    Moments and extrema are exact. With ``bins=None`` percentiles are exact too:
+    members are buffered (the same memory as concatenating them) until the buffer
+    exceeds ``max_exact_bytes`` per variable, after which it is folded into a
+    histogram sketch. With a sketch, percentiles interpolate between order
+    statistics located within their bins, so each is off by at most one bin width
+    for members inside the histogram range (the extremes are exact), and ``bins`` trades memory (2 x ``bins`` bytes per cell,
+    i.e. 128 bins cost as much as 32 float64 members) against accuracy.
+    """
+
+    def __init__(self, bins=None, bounds=None, max_exact_bytes=MAX_EXACT_BYTES):
+        self.bins = bins
+        self.bounds = bounds
+        self.max_exact_bytes = max_exact_bytes
+        self._states = dict()
+        self.n_members = 0
+
+    def add(self, member):
+        """Add one member (Dataset or named DataArray without a realization dim)"""
+        if isinstance(member, xr.DataArray):
+            member = member.to_dataset(name=member.name or 'data')
+        for var, da in member.data_vars.items():
+            da = da.load()
+            if var not in self._states:
+                bounds = self.bounds.get(var) if isinstance(self.bounds, dict) else self.bounds
+                self._states[var] = _VariableState(da, self.bins, bounds, self.max_exact_bytes)
+            self._states[var].add(da.transpose(*self._states[var].dims).values)
+        self.n_members += 1
+        return self
+
+    def merge(self, other):
+        """Merge another accumulator (e.g. built on a different worker) into this one"""
+        for var, state in other._states.items():
+            if var in self._states:
+                self._states[var].merge(state)
+            else:
+                self._states[var] = state
+        self.n_members += other.n_members
+        return self
+
+    def mean_std_max_min(self):
+        """Same output as ``xclim.ensembles.ensemble_mean_std_max_min``"""
+        out = xr.Dataset()
+        for var, s in self._states.items():
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = np.where(s.count > 0, s.mean, np.nan)
+                stdev = np.sqrt(s.m2 / s.count)
+            out[f'{var}_mean'] = s.to_array(mean)
+            out[f'{var}_stdev'] = s.to_array(stdev)
+            out[f'{var}_max'] = s.to_array(np.where(s.count > 0, s.max, np.nan))
+            out[f'{var}_min'] = s.to_array(np.where(s.count > 0, s.min, np.nan))
+        return out
+
+    def percentiles(self, values=(25, 75), split=True):
+        """Same output as ``xclim.ensembles.ensemble_percentiles``
+
+        Args:
+            values (list, optional): percentiles in 0-100. Defaults to (25, 75).
+            split (bool, optional): one variable per percentile ('<var>_p25') if True,
+                otherwise a 'percentiles' dimension. Defaults to True.
+
+        Returns:
+            xarray dataset: ensemble percentiles
+        """
+        out = xr.Dataset()
+        for var, s in self._states.items():
+            per = [s.to_array(s.quantile(p / 100)) for p in values]
+            if split:
+                for p, da in zip(values, per):
+                    out[f'{var}_p{p:02d}' if isinstance(p, int) else f'{var}_p{p}'] = da
+            else:
+                out[var] = xr.concat(per, dim=xr.DataArray(list(values), dims='percentiles', name='percentiles'))
+        return out
+
+
+def ensemble_stats(members, values=(25, 75), bins=None, bounds=None):
+    """Stream members into an accumulator and return (mean/std/max/min, percentiles)
+
+    Args:
+        members (iterable): member Datasets/DataArrays, e.g. a generator opening one file at a time
+        values (list, optional): percentiles in 0-100. Defaults to (25, 75).
+        bins (int, optional): histogram bins per cell for approximate percentiles, None for exact
+            percentiles while the members fit in ``MAX_EXACT_BYTES``. Defaults to None.
+        bounds (tuple or dict, optional): histogram range (per variable if dict). Defaults to the first member's padded range.
+
+    Returns:
+        tuple: (mean/std/max/min dataset, percentile dataset)
+    """
+    acc = EnsembleAccumulator(bins=bins, bounds=bounds)
+    for member in members:
+        acc.add(member)
+    return acc.mean_std_max_min(), acc.percentiles(values, split=True)
@@ -0,0 +1,220 @@
+import json
+import os
+from dataclasses import asdict, dataclass, field, fields
+
+import numpy as np
+
+BACKENDS = ('pbs', 'local', 'threads', 'sync')
+
+# Dask needs several chunks in flight per thread (inputs, outputs, temporaries)
+CHUNKS_PER_THREAD = 8
+MIN_CHUNK_BYTES = 16 * 2**20
+MAX_CHUNK_BYTES = 256 * 2**20
+# Job count and memory per job of the notebooks' PBSCluster cells
+PBS_JOBS = 10
+PBS_MEMORY = 40 * 10**9
+
+
+@dataclass
+class ExecutionConfig:
+    """Where and how the pipelines compute
+
+    ``backend='auto'`` picks PBS when running on a PBS login node (``PBS_O_HOST`` or
+    ``qsub`` on the path with ``queue`` set), otherwise a local process cluster.
+    Unset sizes are derived from the machine.
+    """
+
+    backend: str = 'auto'
+    workers: int = None
+    threads_per_worker: int = 1
+    memory_per_worker: int = None  # bytes
+    target_chunk_bytes: int = None
+    local_directory: str = None
+    # PBS only, defaults as in the notebooks
+    queue: str = None
+    walltime: str = '02:00:00'
+    interface: str = None
+    account: str = None
+    job_name: str = 'winds-of-change-dask'
+    log_directory: str = None
+    resource_spec: str = None
+    job_extra: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_file(cls, path):
+        """Read a JSON configuration; unknown keys are an error"""
+        with open(path) as f:
+            values = json.load(f)
+        unknown = set(values) - {f.name for f in fields(cls)}
+        if unknown:
+            raise ValueError(f'Unknown execution settings: {sorted(unknown)}')
+        return cls(**values)
+
+    @classmethod
+    def from_env(cls, prefix='WOC_'):
+        """Configuration from environment variables, e.g. WOC_BACKEND=local WOC_WORKERS=16"""
+        values = dict()
+        for f in fields(cls):
+            raw = os.environ.get(prefix + f.name.upper())
+            if raw is None or f.name == 'job_extra':
+                continue
+            values[f.name] = int(raw) if f.name in ('workers', 'threads_per_worker', 'memory_per_worker', 'target_chunk_bytes') else raw
+        return cls(**values)
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def available_memory():
+    """Memory available to this process in bytes (cgroup limits respected by psutil)"""
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+
+
+def resolve(config):
+    """Fill in backend, worker count, worker memory and chunk size for this machine
+
+    Args:
+        config (ExecutionConfig): configuration with possibly unset fields
+
+    Returns:
+        ExecutionConfig: a copy with every size set
+    """
+    values = config.to_dict()
+    backend = values['backend']
+    if backend == 'auto':
+        backend = 'pbs' if values['queue'] and ('PBS_O_HOST' in os.environ or _has_qsub()) else 'local'
+    if backend not in BACKENDS:
+        raise ValueError(f'Unknown execution backend: {backend}')
+    values['backend'] = backend
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    if values['workers'] is None:
+        if backend == 'pbs':
+            values['workers'] = PBS_JOBS
+        else:
+            values['workers'] = 1 if backend == 'sync' else max(cpus // values['threads_per_worker'], 1)
+    if values['memory_per_worker'] is None:
+        if backend == 'pbs':
+            values['memory_per_worker'] = PBS_MEMORY
+        else:
+            # Keep 10% of the box for the scheduler, the client and the OS
+            values['memory_per_worker'] = int(available_memory() * 0.9 // values['workers'])
+    if values['target_chunk_bytes'] is None:
+        per_thread = values['memory_per_worker'] // (values['threads_per_worker'] * CHUNKS_PER_THREAD)
+        values['target_chunk_bytes'] = int(np.clip(per_thread, MIN_CHUNK_BYTES, MAX_CHUNK_BYTES))
+    return ExecutionConfig(**values)
+
+
+def _has_qsub():
+    from shutil import which
+    return which('qsub') is not None
+
+
+def auto_chunks(sizes, itemsize, target_bytes, whole=('lat', 'lon'), grow=('time', 'year')):
+    """Chunk sizes from array shape and a byte target
+
+    Dimensions in ``whole`` are kept in one chunk (the map layout every kernel in
+    figure-codes expects), the first present dimension in ``grow`` is sized to
+    reach ``target_bytes``, and all others (member, realization, ...) get 1. If a
+    single map is already larger than the target, latitude is split instead.
+
+    Args:
+        sizes (dict): {dim: length}, e.g. ``ds.sizes``
+        itemsize (int): bytes per element
+        target_bytes (int): approximate chunk size
+        whole (tuple, optional): dims kept whole. Defaults to ('lat', 'lon').
+        grow (tuple, optional): candidate dims to grow. Defaults to ('time', 'year').
+
+    Returns:
+        dict: {dim: chunk size}
+    """
+    chunks = {d: 1 for d in sizes}
+    block = itemsize
+    for d in whole:
+        if d in sizes:
+            chunks[d] = sizes[d]
+            block *= sizes[d]
+    grow_dim = next((d for d in grow if d in sizes), None)
+    if block > target_bytes and 'lat' in sizes:
+        chunks['lat'] = max(int(sizes['lat'] * target_bytes // block), 1)
+    elif grow_dim is not None:
+        chunks[grow_dim] = int(min(max(target_bytes // block, 1), sizes[grow_dim]))
+    return chunks
+
+
+class Execution:
+    """Context manager that starts the configured backend
+
+        with Execution(ExecutionConfig.from_env()) as ex:
+            ds = xr.open_mfdataset(files, chunks=ex.chunks(sizes, 4))
+            ...
+
+    'pbs' and 'local' start a distributed client (replacing the notebooks'
+    PBSCluster/Client/wait_for_workers cells), 'threads' and 'sync' set the dask
+    scheduler without a cluster.
+    """
+
+    def __init__(self, config=None):
+        self.config = resolve(config or ExecutionConfig())
+        self.cluster = None
+        self.client = None
+        self._scheduler = None
+
+    def __enter__(self):
+        import dask
+
+        config = self.config
+        if config.backend in ('threads', 'sync'):
+            scheduler = 'threads' if config.backend == 'threads' else 'synchronous'
+            self._scheduler = dask.config.set(scheduler=scheduler, num_workers=config.workers)
+            self._scheduler.__enter__()
+            return self
+        from dask.distributed import Client
+
+        if config.backend == 'pbs':
+            from dask_jobqueue import PBSCluster
+
+            self.cluster = PBSCluster(
+                job_name=config.job_name,
+                cores=config.threads_per_worker,
+                processes=1,
+                memory=f'{config.memory_per_worker // 2**20}MiB',
+                queue=config.queue,
+                walltime=config.walltime,
+                interface=config.interface,
+                account=config.account,
+                resource_spec=config.resource_spec,
+                local_directory=config.local_directory,
+                log_directory=config.log_directory,
+                **config.job_extra,
+            )
+            self.cluster.scale(jobs=config.workers)
+        else:
+            from dask.distributed import LocalCluster
+
+            self.cluster = LocalCluster(
+                n_workers=config.workers,
+                threads_per_worker=config.threads_per_worker,
+                memory_limit=config.memory_per_worker,
+                local_directory=config.local_directory,
+            )
+        self.client = Client(self.cluster)
+        self.client.wait_for_workers(config.workers)
+        return self
+
+    def __exit__(self, *exc):
+        if self._scheduler is not None:
+            self._scheduler.__exit__(*exc)
+            self._scheduler = None
+        if self.client is not None:
+            self.client.close()
+            self.cluster.close()
+            self.client = self.cluster = None
+        return False
+
+    def chunks(self, sizes, itemsize=4, **kwargs):
+        """``auto_chunks`` with this backend's chunk target"""
+        return auto_chunks(sizes, itemsize, self.config.target_chunk_bytes, **kwargs)
@@ -1,12 +1,9 @@
-import cf_xarray # use cf-xarray so that we can use CF attributes
 import matplotlib.pyplot as plt
-import cartopy.crs as ccrs
-import cartopy.feature as cfeature
-from cartopy.mpl.ticker import LatitudeFormatter, LongitudeFormatter
-import nc_time_axis
 import numpy as np
 
 def fig_50yearmax_trend(cesm2):
+    import cf_xarray # use cf-xarray so that we can use CF attributes
+    import nc_time_axis
 
     fig, ax = plt.subplots(figsize=(7,5), ncols=1, nrows=1, constrained_layout=True)
     ds = cesm2['h1.50yrWSPDSRFMX']
@@ -1,11 +1,8 @@
-import cf_xarray # use cf-xarray so that we can use CF attributes
 import matplotlib.pyplot as plt
-import cartopy.crs as ccrs
-import cartopy.feature as cfeature
-from cartopy.mpl.ticker import LatitudeFormatter, LongitudeFormatter
-import nc_time_axis
 
 def fig_anomaly(cesm2):
+    import cf_xarray # use cf-xarray so that we can use CF attributes
+    import nc_time_axis
     # Set up figure
     # plt.rcParams.update({'font.size': 14})
     fig, ax = plt.subplots(figsize=(10,6), ncols=2, nrows=2, sharex=True, layout="constrained")
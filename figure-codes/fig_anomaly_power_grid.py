@@ -1,14 +1,10 @@
-import cf_xarray # use cf-xarray so that we can use CF attributes
 import matplotlib.pyplot as plt
-import cartopy.crs as ccrs
-import cartopy.feature as cfeature
-from cartopy.mpl.ticker import LatitudeFormatter, LongitudeFormatter
-import nc_time_axis
-import geopandas as gp
-import regionmask
-import numpy as np
+from region_aggregation import RegionAggregator
 
 def fig_anomaly_power_grid(cesm2, model='ssp370'):
+    import cf_xarray # use cf-xarray so that we can use CF attributes
+    import nc_time_axis
+    import geopandas as gp
     # Load power grid data
     power_grids = gp.read_file('data/Control__Areas.geojson')
     usa = power_grids[power_grids.COUNTRY == 'USA']
@@ -20,19 +16,16 @@ def fig_anomaly_power_grid(cesm2, model='ssp370'):
     data = cesm2[model+'.anomaly'].isel(member_id=0).sfcWind
     
     
-    mask = regionmask.mask_geopandas(usa, data.lon, data.lat, numbers='OBJECTID', overlap=False)
-    vals = mask.values
-    keys = sorted(np.unique(vals[np.isfinite(vals)]))
+    # Area-weighted mean over every authority in one sparse matrix multiply
+    aggregate = RegionAggregator.from_geopandas(usa, data.lon, data.lat, numbers='OBJECTID', names='NAME')
+    authorities = aggregate(data).load()
     
     plot_options = False
 
-    for authority in keys:
+    for authority in authorities.region.values:
         authority_name = usa[usa.OBJECTID == authority].NAME
         # Plot mean for this species
-        y = (
-            data.where(mask == authority, drop=True)
-            .mean(['lat', 'lon'])
-        )
+        y = authorities.sel(region=authority)
         # q = (
         #     data.where(mask == authority, drop=True)
         #     .quantile([0.25, 0.75], dim=['lat', 'lon'])
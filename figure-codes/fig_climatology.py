@@ -1,9 +1,4 @@
-import cf_xarray # use cf-xarray so that we can use CF attributes
 import matplotlib.pyplot as plt
-import cartopy.crs as ccrs
-import cartopy.feature as cfeature
-from cartopy.mpl.ticker import LatitudeFormatter, LongitudeFormatter
-import nc_time_axis
 
 year_dict = {
     'Near-term':['2021', '2040'],
@@ -12,6 +7,10 @@ year_dict = {
 }
 
 def fig_climatology(cesm2, period='near-term'):
+    import cf_xarray # use cf-xarray so that we can use CF attributes
+    import cartopy.crs as ccrs
+    import nc_time_axis
+    from map_style import style_map_axis
     
     years = year_dict[period]
 
@@ -30,24 +29,9 @@ def fig_climatology(cesm2, period='near-term'):
         # cb.set_label(label='Decade NSWS Trend', size=18, weight='bold')
         # cb.ax.tick_params(labelsize=16)
         ax.set_title(key)
-        ax.add_feature(cfeature.STATES)
-        ax.coastlines()
-        gl = ax.gridlines(
-            crs=ccrs.PlateCarree(), draw_labels=True,
-            linewidth=1, color='k', alpha=1, linestyle='--')
-        gl.right_labels = None
-        gl.top_labels = None
-        gl.xlines = None
-        gl.ylines = None
-        lon_formatter = LongitudeFormatter(zero_direction_label=True)
-        lat_formatter = LatitudeFormatter()
-        ax.xaxis.set_major_formatter(lon_formatter)
-        ax.yaxis.set_major_formatter(lat_formatter)
         # Add title
         ax.set_title(key, fontsize=22)
-        # Increase the ticksize
-        gl.xlabel_style = {'size': 16, 'color': 'k', 'rotation':30, 'ha':'right'}
-        gl.ylabel_style = {'size': 16, 'color': 'k', 'weight': 'normal'}
+        style_map_axis(ax)
     # Add colorbar
     # cax = fig.add_axes([0.05, 0.05, 0.9, 0.1])
     # Clear settings from scienceplot package
@@ -5,9 +5,14 @@ import matplotlib.pyplot as plt
 # import scienceplots
 # plt.style.use(["science", "nature"])
 
-def fig_historical_validation():
+def fig_historical_validation(path='/glade/u/home/valencig/wind-trend-analysis/data/hist_comp_zeng2019stations.csv'):
     
-    df = pl.read_csv('/glade/u/home/valencig/wind-trend-analysis/data/hist_comp_zeng2019stations.csv')
+    if path.endswith('.csv'):
+        df = pl.read_csv(path)
+    else:
+        # Partitioned parquet dataset written by station_extract
+        from station_extract import read_station_table
+        df = pl.from_pandas(read_station_table(path))
     df_a = df.group_by('year').agg(
         [
             # GSOD
@@ -0,0 +1,257 @@
+import json
+import os
+import re
+from functools import lru_cache
+from glob import glob
+
+import numpy as np
+import xarray as xr
+
+from member_reducer import parse_cesm_filename
+
+INDEX_VERSION = 3
+# Approximate size of one dask block of the virtual dataset
+TARGET_BLOCK_BYTES = 64 * 2**20
+# Spatial blocks per axis at most, so regional selections skip most of a file
+MAX_SPATIAL_BLOCKS = 4
+
+
+def split_simulation(sim):
+    """Experiment and forcing from a CESM2-LE simulation name, e.g. BSSP370smbb -> ('SSP370', 'smbb')"""
+    match = re.fullmatch(r'B(HIST|SSP\d+)(\w+)', sim)
+    if match is None:
+        return sim, sim
+    return match.group(1), match.group(2)
+
+
+def _time_record(time):
+    values = np.asarray(time.values, dtype='float64')
+    record = {'units': time.attrs.get('units'), 'calendar': time.attrs.get('calendar', 'standard'), 'count': len(values)}
+    steps = np.diff(values)
+    if len(values) > 1 and np.allclose(steps, steps[0]):
+        # Regular axis: start and step are enough
+        record.update(start=float(values[0]), step=float(steps[0]))
+    else:
+        record.update(values=values.tolist())
+    return record
+
+
+def _time_values(record):
+    if 'values' in record:
+        return np.asarray(record['values'])
+    return record['start'] + record['step'] * np.arange(record['count'])
+
+
+def _decoded_times(record):
+    """Times of one file decoded with its own units and calendar"""
+    return xr.coding.times.decode_cf_datetime(_time_values(record), record['units'], record['calendar'])
+
+
+def _same_grid(a, b):
+    return all(len(a[c]) == len(b[c]) and np.allclose(a[c], b[c]) for c in ('lat', 'lon'))
+
+
+def _chunk_shape(da):
+    chunks = da.encoding.get('chunksizes')
+    return None if chunks is None or da.encoding.get('contiguous') else [int(c) for c in chunks]
+
+
+def _scan(path):
+    sim, member = parse_cesm_filename(path)
+    experiment, forcing = split_simulation(sim)
+    # Times stay encoded so no calendar decoding happens during the scan
+    with xr.open_dataset(path, decode_times=False) as ds:
+        data_vars = [v for v in ds.data_vars if {'time', 'lat', 'lon'} <= set(ds[v].dims)]
+        entry = {
+            'mtime': os.path.getmtime(path),
+            'size': os.path.getsize(path),
+            'simulation': sim,
+            'experiment': experiment,
+            'forcing': forcing,
+            'member': member,
+            'variables': {
+                v: {
+                    'dims': list(ds[v].dims),
+                    'dtype': str(ds[v].dtype),
+                    # HDF5 chunk shape (None if contiguous), used to align the dask blocks
+                    'chunk_shape': _chunk_shape(ds[v]),
+                }
+                for v in data_vars
+            },
+            'time': _time_record(ds.time),
+        }
+        grid = {'lat': ds.lat.values.tolist(), 'lon': ds.lon.values.tolist()}
+    return entry, grid
+
+
+def build_index(root, index_path, pattern='*.nc'):
+    """Build or incrementally refresh a JSON index of a timeseries directory
+
+    Only files that are new or whose size/mtime changed are opened; files that
+    disappeared are dropped from the index.
+
+    Args:
+        root (str): directory with the NetCDF timeseries files
+        index_path (str): JSON index file
+        pattern (str, optional): glob pattern of files to index. Defaults to '*.nc'.
+
+    Returns:
+        dict: the index
+    """
+    index = {'version': INDEX_VERSION, 'root': root, 'grid': None, 'files': {}}
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            stored = json.load(f)
+        # Indexes written by an older layout are rebuilt from scratch
+        if stored.get('version') == INDEX_VERSION:
+            index = stored
+    files = sorted(glob(os.path.join(root, pattern)))
+    known = index['files']
+    for path in set(known) - set(files):
+        del known[path]
+    for path in files:
+        entry = known.get(path)
+        if entry and entry['mtime'] == os.path.getmtime(path) and entry['size'] == os.path.getsize(path):
+            continue
+        known[path], grid = _scan(path)
+        if index['grid'] is None:
+            index['grid'] = grid
+        elif not _same_grid(index['grid'], grid):
+            raise ValueError(f'{path} is not on the lat/lon grid of the other indexed files')
+    tmp = f'{index_path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp, index_path)
+    return index
+
+
+def load_index(index_path):
+    with open(index_path) as f:
+        return json.load(f)
+
+
+def _aligned(size, chunk, target):
+    """Block length: a multiple of the stored chunk length close to ``target``"""
+    chunk = max(min(chunk, size), 1)
+    return int(min(max(round(target / chunk), 1) * chunk, size))
+
+
+def block_layout(variable, shape, itemsize, target_bytes=TARGET_BLOCK_BYTES):
+    """(time, lat, lon) dask block lengths aligned to the file's HDF5 chunks
+
+    Latitude and longitude are split into at most ``MAX_SPATIAL_BLOCKS`` tiles per
+    axis, and time slabs are grown in whole stored chunks until a block holds about
+    ``target_bytes``. A block therefore never straddles a stored chunk, and time or
+    region selections only read the slabs they touch.
+
+    Args:
+        variable (dict): index entry of the variable ('dims', 'chunk_shape')
+        shape (tuple): (time, lat, lon) shape of one file
+        itemsize (int): bytes per element
+        target_bytes (int, optional): approximate block size. Defaults to TARGET_BLOCK_BYTES.
+
+    Returns:
+        tuple: (time, lat, lon) block lengths
+    """
+    stored = dict(zip(variable['dims'], variable['chunk_shape'] or []))
+    nt, ny, nx = shape
+    by = _aligned(ny, stored.get('lat', ny), ny / MAX_SPATIAL_BLOCKS) if 'lat' in stored else ny
+    bx = _aligned(nx, stored.get('lon', nx), nx / MAX_SPATIAL_BLOCKS) if 'lon' in stored else nx
+    bt = _aligned(nt, stored.get('time', 1), target_bytes / (by * bx * itemsize))
+    return bt, by, bx
+
+
+@lru_cache(maxsize=64)
+def _open(path, mtime):
+    # One handle per file (and version of it) per process, shared by all its blocks
+    return xr.open_dataset(path, decode_times=False)
+
+
+def _read_block(path, mtime, var, time, lat, lon):
+    # Lazy indexing: only the hyperslab is read from the file
+    return _open(path, mtime)[var].transpose('time', 'lat', 'lon').isel(time=time, lat=lat, lon=lon).values
+
+
+def _file_array(path, mtime, var, shape, blocks, dtype):
+    import dask
+    import dask.array as dsa
+
+    read = dask.delayed(_read_block, pure=True)
+    edges = [list(range(0, n, b)) + [n] for n, b in zip(shape, blocks)]
+    slabs = [[slice(lo, hi) for lo, hi in zip(e[:-1], e[1:])] for e in edges]
+    return dsa.block([[[
+        dsa.from_delayed(read(path, mtime, var, t, y, x), shape=(t.stop - t.start, y.stop - y.start, x.stop - x.start), dtype=dtype)
+        for x in slabs[2]] for y in slabs[1]] for t in slabs[0]])
+
+
+def open_virtual(index, var, forcings=None, members=None):
+    """Lazy (forcing, member, time, lat, lon) hypercube straight from the index
+
+    No file is opened here: shapes, dtypes, times and the grid come from the index.
+    Each file's times are decoded with its own units and calendar. Each file is
+    split into blocks aligned to its stored chunks (``block_layout``), each read as
+    a hyperslab only when computed, through one open handle per file and process.
+    Members missing a file are NaN for that period.
+
+    Args:
+        index (dict): index from ``build_index``/``load_index``
+        var (str): variable, e.g. 'WSPDSRFAV'
+        forcings (list, optional): forcings to include. Defaults to all.
+        members (list, optional): members to include. Defaults to all.
+
+    Returns:
+        xarray DataArray: lazy hypercube with decoded time
+    """
+    import dask.array as dsa
+
+    entries = [(p, e) for p, e in index['files'].items() if var in e['variables']]
+    if forcings is not None:
+        entries = [(p, e) for p, e in entries if e['forcing'] in forcings]
+    if members is not None:
+        entries = [(p, e) for p, e in entries if e['member'] in members]
+    if not entries:
+        raise KeyError(f'No indexed files contain {var}')
+    lat, lon = np.asarray(index['grid']['lat']), np.asarray(index['grid']['lon'])
+    first = entries[0][1]
+    dtype = np.dtype(first['variables'][var]['dtype'])
+    calendars = {e['time']['calendar'] for _, e in entries}
+    if len(calendars) > 1:
+        raise ValueError(f'Indexed files of {var} use different calendars: {sorted(calendars)}')
+    # Files covering the same period share their first (decoded) time
+    segments = dict()
+    by_key = dict()
+    for path, e in entries:
+        values = _decoded_times(e['time'])
+        segments.setdefault(values[0], values)
+        key = (e['forcing'], e['member'], values[0])
+        if key in by_key:
+            raise ValueError(f'Files {by_key[key]} and {path} both map to forcing/member/start {key}')
+        by_key[key] = path
+    starts = sorted(segments)
+    counts = {start: len(segments[start]) for start in starts}
+    time = np.concatenate([segments[start] for start in starts])
+    forcing_names = sorted({e['forcing'] for _, e in entries})
+    member_names = sorted({e['member'] for _, e in entries})
+    cube = []
+    for forcing in forcing_names:
+        per_member = []
+        for member in member_names:
+            blocks = []
+            for start in starts:
+                shape = (counts[start], len(lat), len(lon))
+                if (forcing, member, start) in by_key:
+                    path = by_key[(forcing, member, start)]
+                    layout = block_layout(index['files'][path]['variables'][var], shape, dtype.itemsize)
+                    blocks.append(_file_array(path, index['files'][path]['mtime'], var, shape, layout, dtype))
+                else:
+                    layout = block_layout(first['variables'][var], shape, dtype.itemsize)
+                    blocks.append(dsa.full(shape, np.nan, dtype=dtype, chunks=layout))
+            per_member.append(dsa.concatenate(blocks, axis=0))
+        cube.append(dsa.stack(per_member))
+    data = dsa.stack(cube)
+    return xr.DataArray(
+        data,
+        dims=('forcing', 'member', 'time', 'lat', 'lon'),
+        coords={'forcing': forcing_names, 'member': member_names, 'time': time, 'lat': lat, 'lon': lon},
+        name=var,
+    )
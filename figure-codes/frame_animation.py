@@ -0,0 +1,165 @@
+"""Stream frame animations (zonal-mean sections, wind maps) to GIF or video
+
+Replacement for the ``FuncAnimation`` + ``to_jshtml`` cells: frame data is sliced
+once, frames are drawn by worker processes that each keep one figure with fixed
+levels and a fixed colorbar, and the encoded frames are written to the output
+file in order as they arrive.
+
+    style = FrameStyle(levels=np.linspace(-5, 5, 21), ylim=(1000, 0), xlim=(90, -90),
+                       colorbar_label='Zonal-Mean meridional wind\\ndefined on ilev [m s$^{-1}$]')
+    animate([forcings['smbb'].Vzm.isel(realization=0)], 'figures/global_zonal.gif', style,
+            frames=np.arange(1978, 2100), fps=5)
+"""
+from collections import deque
+from dataclasses import dataclass
+from multiprocessing import Pool
+
+import numpy as np
+import xarray as xr
+
+
+@dataclass
+class FrameStyle:
+    """Fixed styling shared by every frame"""
+
+    levels: np.ndarray
+    cmap: str = 'seismic'
+    xlim: tuple = None
+    ylim: tuple = None
+    line_contours: bool = True  # black contours, dashed below zero
+    colorbar_label: str = None
+    title: str = '{label}'
+    panel_titles: tuple = None
+    ncols: int = 1
+    figsize: tuple = (11, 8)
+    map: bool = False  # PlateCarree panels with the shared base-map template
+    dpi: int = 100
+
+
+def frame_stack(panels, frame_dim='year', frames=None):
+    """Slice every frame of every panel in one vectorized load
+
+    Args:
+        panels (list): 2D-per-frame DataArrays with identical dims, e.g. one per member or field
+        frame_dim (str, optional): dimension animated over. Defaults to 'year'.
+        frames (array-like, optional): frame coordinate values. Defaults to all.
+
+    Returns:
+        tuple: (frame labels, (frame, panel, y, x) array, x values, y values)
+    """
+    stacked = xr.concat(panels, dim='panel', join='override')
+    if frames is not None:
+        stacked = stacked.sel({frame_dim: frames})
+    y, x = [d for d in stacked.dims if d not in (frame_dim, 'panel')]
+    stacked = stacked.transpose(frame_dim, 'panel', y, x).load()
+    return stacked[frame_dim].values, stacked.values, stacked[x].values, stacked[y].values
+
+
+# Per-process figure state, built once by _init_worker
+_state = dict()
+
+
+def _init_worker(style, x, y, npanels):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import BoundaryNorm
+    from matplotlib.cm import ScalarMappable
+
+    nrows = -(-npanels // style.ncols)
+    subplot_kw = None
+    if style.map:
+        import cartopy.crs as ccrs
+        from map_style import style_map_axis
+        subplot_kw = {'projection': ccrs.PlateCarree()}
+    fig, axes = plt.subplots(nrows, style.ncols, figsize=style.figsize, dpi=style.dpi,
+                             squeeze=False, subplot_kw=subplot_kw, layout='constrained')
+    for ax in axes.ravel()[npanels:]:
+        ax.set_visible(False)
+    axes = axes.ravel()[:npanels]
+    for i, ax in enumerate(axes):
+        if style.map:
+            style_map_axis(ax, label_size=10)
+        if style.xlim is not None:
+            ax.set_xlim(style.xlim)
+        if style.ylim is not None:
+            ax.set_ylim(style.ylim)
+        if style.panel_titles is not None:
+            ax.set_title(style.panel_titles[i])
+    norm = BoundaryNorm(style.levels, plt.get_cmap(style.cmap).N, extend='both')
+    cbar = fig.colorbar(ScalarMappable(norm=norm, cmap=style.cmap), ax=list(axes))
+    if style.colorbar_label:
+        cbar.set_label(style.colorbar_label)
+    _state.update(fig=fig, axes=axes, style=style, x=x, y=y, artists=[])
+
+
+def _render_frame(args):
+    """Draw one frame on the cached figure and return it as an RGB array"""
+    label, frame = args
+    fig, axes, style = _state['fig'], _state['axes'], _state['style']
+    for artist in _state['artists']:
+        artist.remove()
+    artists = []
+    kwargs = dict()
+    if style.map:
+        import cartopy.crs as ccrs
+        kwargs['transform'] = ccrs.PlateCarree()
+    for ax, values in zip(axes, frame):
+        artists.append(ax.contourf(_state['x'], _state['y'], values, levels=style.levels,
+                                   cmap=style.cmap, extend='both', **kwargs))
+        if style.line_contours:
+            artists.append(ax.contour(_state['x'], _state['y'], values, levels=style.levels, colors='k',
+                                      linestyles=np.where(style.levels >= 0, '-', '--'), **kwargs))
+    fig.suptitle(style.title.format(label=label))
+    # Axis limits are fixed, so plotting must not rescale them
+    for ax in axes:
+        if style.xlim is not None:
+            ax.set_xlim(style.xlim)
+        if style.ylim is not None:
+            ax.set_ylim(style.ylim)
+    _state['artists'] = artists
+    fig.canvas.draw()
+    return np.asarray(fig.canvas.buffer_rgba())[..., :3].copy()
+
+
+def _writer(path, fps):
+    import imageio.v2 as imageio
+
+    if path.endswith('.gif'):
+        return imageio.get_writer(path, mode='I', duration=1000 / fps, loop=0)
+    return imageio.get_writer(path, fps=fps, macro_block_size=1)
+
+
+def animate(panels, path, style, frame_dim='year', frames=None, fps=5, processes=4, window=None):
+    """Render an animation to a GIF or video file in bounded memory
+
+    Args:
+        panels (list): DataArrays, one per panel (member, field or forcing), 2D per frame
+        path (str): output file, '.gif' or a video format supported by ffmpeg (e.g. '.mp4')
+        style (FrameStyle): fixed levels, colormap, limits and labels
+        frame_dim (str, optional): dimension animated over. Defaults to 'year'.
+        frames (array-like, optional): frame coordinate values. Defaults to all.
+        fps (int, optional): frames per second. Defaults to 5.
+        processes (int, optional): worker processes drawing frames. Defaults to 4.
+        window (int, optional): frames rendered or waiting to be written at most. Defaults to 2 x ``processes``.
+
+    Returns:
+        int: number of frames written
+    """
+    labels, data, x, y = frame_stack(panels, frame_dim, frames)
+    window = 2 * processes if window is None else window
+    count = 0
+    with Pool(processes, initializer=_init_worker, initargs=(style, x, y, data.shape[1])) as pool, \
+            _writer(path, fps) as writer:
+        # A fixed window of submitted frames, written in order: a slow writer stalls
+        # submission instead of letting rendered frames pile up
+        pending = deque()
+        for args in zip(labels, data):
+            if len(pending) >= window:
+                writer.append_data(pending.popleft().get())
+                count += 1
+            pending.append(pool.apply_async(_render_frame, (args,)))
+        while pending:
+            writer.append_data(pending.popleft().get())
+            count += 1
+    return count
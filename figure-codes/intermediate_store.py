@@ -0,0 +1,141 @@
+import os
+from collections.abc import Mapping
+
+import numpy as np
+import xarray as xr
+
+# Around 16 MB per chunk keeps both map and time-series reads to a few chunks per year
+TARGET_CHUNK_BYTES = 16 * 2**20
+
+
+def _steps_per_year(ds, dim):
+    """Most steps of ``dim`` in one year (the whole axis if it is not datetime-like)"""
+    try:
+        years = ds[dim].dt.year.values
+    except (AttributeError, TypeError):
+        return ds.sizes[dim]
+    return int(np.unique(years, return_counts=True)[1].max())
+
+
+def balanced_chunks(ds, target_bytes=TARGET_CHUNK_BYTES, time_dims=('time', 'year')):
+    """Chunk layout serving both map access and time-series access
+
+    'time' is chunked one year of steps at a time (365 days or 12 months), so a
+    time series at one cell is one chunk read per year and yearly appends fill
+    whole chunks. 'year' (already reduced, so small per cell) is kept whole. lat/lon
+    are tiled in square-ish blocks grown until the chunk reaches ``target_bytes``,
+    so a map at one time or year is a handful of chunks (about six on the f09 grid
+    for daily data). All other dimensions (member_id, realization, forecast, ...) get
+    chunks of 1 so members and scenarios can be appended independently.
+
+    Args:
+        ds (xarray dataset): dataset to lay out
+        target_bytes (int, optional): approximate chunk size. Defaults to TARGET_CHUNK_BYTES.
+        time_dims (tuple, optional): time-like dims. Defaults to ('time', 'year').
+
+    Returns:
+        dict: {dim: chunk size}
+    """
+    itemsize = max((v.dtype.itemsize for v in ds.data_vars.values()), default=8)
+    chunks = {d: 1 for d in ds.dims}
+    ntime = 1
+    for d in time_dims:
+        if d in ds.dims:
+            chunks[d] = _steps_per_year(ds, d) if d == 'time' else ds.sizes[d]
+            ntime *= chunks[d]
+    if 'lat' in ds.dims and 'lon' in ds.dims:
+        side = int(np.sqrt(max(target_bytes // (itemsize * ntime), 1)))
+        chunks['lat'] = min(max(side, 1), ds.sizes['lat'])
+        chunks['lon'] = min(max(side, 1), ds.sizes['lon'])
+    return chunks
+
+
+def _clear_encoding(ds):
+    # Chunk encodings from the source files conflict with the new layout
+    for v in ds.variables.values():
+        for key in ('chunks', 'preferred_chunks', 'zlib', 'complevel', 'shuffle', 'contiguous'):
+            v.encoding.pop(key, None)
+    return ds
+
+
+class IntermediateStore:
+    """Directory of consolidated Zarr stores, one per derived product key
+
+    Replaces the ``da.compute().to_netcdf(.../key.task.nc)`` dumps: writes go straight
+    from the dask workers, new members, scenarios or years are appended, and
+    products are opened lazily with consolidated metadata.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, f'{key}.zarr')
+
+    def __contains__(self, key):
+        return os.path.isdir(self.path(key))
+
+    def keys(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(f[:-5] for f in os.listdir(self.root) if f.endswith('.zarr'))
+
+    def write(self, key, ds, chunks=None):
+        """Write (or overwrite) a product from the workers, without a client-side compute
+
+        Args:
+            key (str): product key, e.g. 'ssp370.anomaly'
+            ds (xarray dataset or DataArray): product, usually dask-backed
+            chunks (dict, optional): chunk layout. Defaults to ``balanced_chunks``.
+        """
+        if isinstance(ds, xr.DataArray):
+            ds = ds.to_dataset()
+        ds = _clear_encoding(ds.chunk(chunks or balanced_chunks(ds)))
+        os.makedirs(self.root, exist_ok=True)
+        ds.to_zarr(self.path(key), mode='w', consolidated=True)
+
+    def append(self, key, ds, dim):
+        """Append new members, years or time steps along ``dim``
+
+        Args:
+            key (str): product key
+            ds (xarray dataset or DataArray): new data, matching the stored layout apart from ``dim``
+            dim (str): dimension to append along, e.g. 'member_id' or 'year'
+        """
+        if key not in self:
+            return self.write(key, ds)
+        if isinstance(ds, xr.DataArray):
+            ds = ds.to_dataset()
+        stored = self.open(key)
+        chunks = {d: stored.chunks[d][0] for d in ds.dims if d in stored.chunks}
+        ds = _clear_encoding(ds.chunk(chunks))
+        ds.to_zarr(self.path(key), append_dim=dim, consolidated=True)
+
+    def open(self, key):
+        """Lazily open a product"""
+        return xr.open_zarr(self.path(key), consolidated=True)
+
+    def as_mapping(self):
+        """Read-only dict view, e.g. the ``cesm2`` dictionary the figure functions consume"""
+        return StoreMapping(self)
+
+
+class StoreMapping(Mapping):
+    """Dictionary of lazily opened products; each key is opened on first access"""
+
+    def __init__(self, store):
+        self.store = store
+        self._opened = dict()
+
+    def __getitem__(self, key):
+        if key not in self._opened:
+            if key not in self.store:
+                raise KeyError(key)
+            self._opened[key] = self.store.open(key)
+        return self._opened[key]
+
+    def __iter__(self):
+        return iter(self.store.keys())
+
+    def __len__(self):
+        return len(self.store.keys())
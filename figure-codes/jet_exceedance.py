@@ -0,0 +1,177 @@
+import numpy as np
+import xarray as xr
+
+# Hemispheric bands used in the jet analysis
+BANDS = {
+    'NH': (20, 60),
+    'SH': (-60, -20),
+}
+
+
+class ExceedanceSketch:
+    """Fixed-memory per-cell histogram over an explicit value range
+
+    Memory is bins x cells, independent of the number of days and years. Values
+    outside ``bounds`` are counted in the edge bins, so the bounds must cover the
+    data (``exceedance_stats`` takes them from a min/max pass when not given).
+    """
+
+    def __init__(self, bounds, bins=512):
+        if bounds is None or not bounds[1] > bounds[0]:
+            raise ValueError(f'ExceedanceSketch needs bounds (low, high) with low < high, got {bounds}')
+        self.bins = bins
+        self.bounds = bounds
+        self.edges = np.linspace(bounds[0], bounds[1], bins + 1)
+        self.cell_dims = None
+        self.cell_coords = None
+        self.cell_shape = None
+        self.counts = None  # (bins, cells)
+
+    def _cells(self, block, sample_dims):
+        """(time x samples, cells) values of a block, remembering the cell layout"""
+        if self.cell_dims is None:
+            self.cell_dims = [d for d in block.dims if d != 'time' and d not in sample_dims]
+            self.cell_coords = {d: block[d].values for d in self.cell_dims if d in block.coords}
+            self.cell_shape = tuple(block.sizes[d] for d in self.cell_dims)
+        block = block.transpose('time', *sample_dims, *self.cell_dims)
+        ncell = int(np.prod(self.cell_shape, dtype=int))
+        nsample = int(np.prod([block.sizes[d] for d in sample_dims], dtype=int))
+        return block.values.reshape(-1, ncell), np.repeat(block.time.dt.year.values, nsample)
+
+    def add(self, block, sample_dims=('lon',)):
+        """Add a block of daily data
+
+        Args:
+            block (xarray DataArray): data with 'time', ``sample_dims`` and the cell dims (e.g. lat)
+            sample_dims (tuple, optional): dims pooled with time into each cell's sample. Defaults to ('lon',).
+        """
+        v, _ = self._cells(block, sample_dims)
+        ncell = v.shape[1]
+        valid = np.isfinite(v)
+        b = np.clip(np.searchsorted(self.edges, v, side='right') - 1, 0, self.bins - 1)
+        flat = (b * ncell + np.arange(ncell))[valid]
+        counts = np.bincount(flat, minlength=self.bins * ncell).reshape(self.bins, ncell)
+        self.counts = counts if self.counts is None else self.counts + counts
+
+    def _to_array(self, values, leading=()):
+        dims = tuple(d for d, _ in leading) + tuple(self.cell_dims)
+        coords = dict(self.cell_coords)
+        coords.update({d: c for d, c in leading})
+        return xr.DataArray(values.reshape(values.shape[:len(leading)] + self.cell_shape), dims=dims, coords=coords)
+
+    def quantile(self, q):
+        """Per-cell quantile(s) of every value added so far (within one bin width)"""
+        return self._to_array(_hist_quantile(self.counts, self.edges, q))
+
+
+class _YearlyExceedances:
+    """Per-year count and sum of the values at or above a per-cell threshold"""
+
+    def __init__(self, sketch, threshold):
+        self.sketch = sketch
+        self.threshold = threshold
+        self.counts = dict()  # year -> (cells,)
+        self.sums = dict()
+
+    def add(self, block, sample_dims=('lon',)):
+        v, years = self.sketch._cells(block, sample_dims)
+        above = v >= self.threshold[None]
+        for year in np.unique(years):
+            a = above[years == year]
+            self.counts[year] = self.counts.get(year, 0) + a.sum(axis=0)
+            self.sums[year] = self.sums.get(year, 0) + np.where(a, v[years == year], 0).sum(axis=0)
+
+    def to_dataset(self, q):
+        sketch = self.sketch
+        years = np.array(sorted(self.counts))
+        yearly_count = np.stack([self.counts[y] for y in years]).astype(float)
+        yearly_sum = np.stack([self.sums[y] for y in years])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            yearly_mean = yearly_sum / yearly_count
+            mean = yearly_sum.sum(axis=0) / yearly_count.sum(axis=0)
+        return xr.Dataset(
+            dict(
+                threshold=sketch._to_array(self.threshold),
+                mean=sketch._to_array(mean),
+                count=sketch._to_array(yearly_count.sum(axis=0)),
+                yearly_mean=sketch._to_array(yearly_mean, leading=[('year', years)]),
+                yearly_count=sketch._to_array(yearly_count, leading=[('year', years)]),
+            ),
+            attrs={'quantile': q},
+        )
+
+
+def _hist_quantile(counts, edges, q):
+    cum = np.cumsum(counts, axis=0)
+    total = cum[-1]
+    target = np.asarray(q) * total
+    b = np.clip((cum < target[None]).sum(axis=0), 0, len(edges) - 2)
+    below = np.where(b > 0, np.take_along_axis(cum, np.maximum(b - 1, 0)[None], 0)[0], 0)
+    inbin = np.take_along_axis(counts, b[None], 0)[0]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        frac = np.clip((target - below) / inbin, 0, 1)
+    value = edges[b] + frac * (edges[b + 1] - edges[b])
+    return np.where(total > 0, value, np.nan)
+
+
+def exceedance_stats(da, q=0.99, sample_dims=('lon',), bins=512, bounds=None, block=365):
+    """Stream daily data and return tail thresholds plus exceedance statistics
+
+    Replaces the ``U200_percentiles``/``ug_percentiles`` + ``where(U200 >= p99)`` chain.
+    The daily array is read ``block`` days at a time and never held in memory:
+    a histogram pass gives each cell's threshold (within one bin width), and a second
+    pass counts and sums the values at or above it per year. Without ``bounds`` a
+    min/max reduction comes first, so no value falls outside the histogram. Memory
+    is bins x cells plus the years x cells outputs.
+
+    Args:
+        da (xarray DataArray): daily data, e.g. U200 or ug for one realization
+        q (float, optional): tail quantile. Defaults to 0.99.
+        sample_dims (tuple, optional): dims pooled with time per cell. Defaults to ('lon',) as in the jet files.
+        bins (int, optional): histogram bins. Defaults to 512.
+        bounds (tuple, optional): histogram range covering the data. Defaults to the data's min and max.
+        block (int, optional): days per step. Defaults to 365.
+
+    Returns:
+        xarray dataset: threshold, mean, count, yearly_mean and yearly_count per cell
+    """
+    if bounds is None:
+        bounds = (float(da.min()), float(da.max()))
+        if not bounds[1] > bounds[0]:
+            bounds = (bounds[0] - 0.5, bounds[0] + 0.5)
+    sketch = ExceedanceSketch(bounds, bins=bins)
+    blocks = [slice(start, start + block) for start in range(0, da.sizes['time'], block)]
+    for time in blocks:
+        sketch.add(da.isel(time=time).load(), sample_dims=sample_dims)
+    exceed = _YearlyExceedances(sketch, sketch.quantile(q).values.ravel())
+    for time in blocks:
+        exceed.add(da.isel(time=time).load(), sample_dims=sample_dims)
+    return exceed.to_dataset(q)
+
+
+def band_summary(stats, bands=BANDS):
+    """Latitude-band yearly exceedance means from the reduced outputs
+
+    Cells are combined with their exceedance counts as weights, so the result matches
+    averaging the exceeding daily values directly.
+
+    Args:
+        stats (xarray dataset): output of ``exceedance_stats`` (any extra dims such as realization are kept)
+        bands (dict, optional): {name: (south, north)}. Defaults to BANDS.
+
+    Returns:
+        xarray DataArray: yearly exceedance mean on a 'band' dimension
+    """
+    out = []
+    for name, (south, north) in bands.items():
+        sub = stats.sel(lat=slice(south, north)) if stats.lat[0] < stats.lat[-1] else stats.sel(lat=slice(north, south))
+        weights = sub.yearly_count
+        dims = [d for d in weights.dims if d not in ('year', 'realization')]
+        series = (sub.yearly_mean * weights).sum(dims) / weights.sum(dims)
+        out.append(series.expand_dims(band=[name]))
+    return xr.concat(out, 'band')
+
+
+def normalize(series, dim='year'):
+    """Min/max normalization along ``dim`` (as used for the u99 panels)"""
+    return (series - series.min(dim)) / (series.max(dim) - series.min(dim))
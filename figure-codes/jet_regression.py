@@ -0,0 +1,114 @@
+import numpy as np
+import xarray as xr
+
+def _terms(x, y, dims):
+    # einsum reductions: TS on (realization, time) is never expanded to every lon
+    valid = x.notnull() & y.notnull()
+    x0, y0 = x.fillna(0), y.fillna(0)
+    return xr.Dataset(dict(
+        n=valid.sum(dims).astype(float),
+        sx=xr.dot(x0, valid, dims=dims),
+        sy=xr.dot(y0, valid, dims=dims),
+        sxx=xr.dot(x0 ** 2, valid, dims=dims),
+        sxy=xr.dot(x0, y0, dims=dims),
+        syy=xr.dot(y0 ** 2, valid, dims=dims),
+    ))
+
+
+def _moments(x, y, dims, group=None):
+    """Sufficient statistics of a simple regression, reduced over ``dims``
+
+    Products are reduced with ``xr.dot`` so no full-size x * y temporaries are built.
+    With ``group`` (a time coordinate such as 'time.season' or 'boot_block') the
+    moments are reduced per group and stacked along the group's dimension.
+    """
+    if group is None:
+        return _terms(x, y, dims)
+    # Grouped moments always pool time within each group
+    dims = list(dims) + ['time'] * ('time' not in dims)
+    labels = (y if 'time' in y.dims else x)[group]
+    name = group.split('.')[-1]
+    pieces = []
+    values = np.unique(labels.values)
+    for value in values:
+        at = np.flatnonzero(labels.values == value)
+        xs = x.isel(time=at) if 'time' in x.dims else x
+        ys = y.isel(time=at) if 'time' in y.dims else y
+        pieces.append(_terms(xs, ys, dims))
+    return xr.concat(pieces, dim=xr.DataArray(values, dims=name, name=name))
+
+
+def _fit(m):
+    """Slope, intercept, standard error and r from regression moments"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        vx = m.sxx - m.sx ** 2 / m.n
+        vy = m.syy - m.sy ** 2 / m.n
+        cxy = m.sxy - m.sx * m.sy / m.n
+        slope = cxy / vx
+        intercept = (m.sy - slope * m.sx) / m.n
+        sse = (vy - slope * cxy).clip(min=0)
+        stderr = np.sqrt(sse / (m.n - 2) / vx)
+        r = cxy / np.sqrt(vx * vy)
+    return xr.Dataset(dict(slope=slope, intercept=intercept, stderr=stderr, rvalue=r, n=m.n))
+
+
+def linregress(y, x, dims=('time', 'lon'), by_season=False):
+    """Batched ``scipy.stats.linregress`` of y on x over ``dims``, for every other cell
+
+    All realizations, latitudes (and seasons) are fitted in one vectorized pass.
+    ``get_frac_change`` is ``linregress(TS, wind).slope`` and ``get_std`` is
+    ``stderr * sqrt(n)`` of the same fit.
+
+    Args:
+        y (xarray DataArray): dependent variable
+        x (xarray DataArray): independent variable, broadcast against y
+        dims (tuple, optional): dims pooled into each regression. Defaults to ('time', 'lon').
+        by_season (bool, optional): Whether to fit each season (DJF/MAM/JJA/SON) separately. Defaults to False.
+
+    Returns:
+        xarray dataset: slope, intercept, stderr, rvalue, n and std (= stderr * sqrt(n))
+    """
+    dims = [d for d in dims if d in x.dims or d in y.dims]
+    group = 'time.season' if by_season else None
+    result = _fit(_moments(x, y, dims, group=group))
+    result['std'] = result.stderr * np.sqrt(result.n)
+    return result
+
+
+def block_bootstrap(y, x, dims=('time', 'lon'), block=365, n_boot=1000, alpha=0.05, seed=0):
+    """Block-bootstrap confidence interval of the regression slope
+
+    Moments are reduced once per contiguous block of ``block`` time steps. Each
+    replicate is then a weighted sum of block moments, so every replicate for every
+    cell is computed in one weighted sum rather than by refitting the data.
+
+    Args:
+        y (xarray DataArray): dependent variable
+        x (xarray DataArray): independent variable, broadcast against y
+        dims (tuple, optional): dims pooled into each regression (must include 'time'). Defaults to ('time', 'lon').
+        block (int, optional): block length in time steps. Defaults to 365.
+        n_boot (int, optional): number of bootstrap replicates. Defaults to 1000.
+        alpha (float, optional): the interval is the (alpha/2, 1-alpha/2) range. Defaults to 0.05.
+        seed (int, optional): random seed. Defaults to 0.
+
+    Returns:
+        xarray dataset: slope, slope_lower and slope_upper
+    """
+    dims = [d for d in dims if d in x.dims or d in y.dims]
+    ntime = max(x.sizes.get('time', 0), y.sizes.get('time', 0))
+    labels = xr.DataArray(np.arange(ntime) // block, dims='time')
+    x, y = x.assign_coords(boot_block=labels), y.assign_coords(boot_block=labels)
+    per_block = _moments(x, y, dims, group='boot_block').load()
+    nblocks = per_block.sizes['boot_block']
+    rng = np.random.default_rng(seed)
+    # Number of times each block is drawn in each replicate
+    draws = rng.integers(0, nblocks, size=(n_boot, nblocks))
+    weights = np.stack([np.bincount(d, minlength=nblocks) for d in draws])
+    weights = xr.DataArray(weights.astype(float), dims=('replicate', 'boot_block'))
+    replicates = _fit((per_block * weights).sum('boot_block')).slope
+    full = _fit(per_block.sum('boot_block')).slope
+    return xr.Dataset(dict(
+        slope=full,
+        slope_lower=replicates.quantile(alpha / 2, 'replicate').drop_vars('quantile'),
+        slope_upper=replicates.quantile(1 - alpha / 2, 'replicate').drop_vars('quantile'),
+    ))
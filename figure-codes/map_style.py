@@ -0,0 +1,34 @@
+def style_map_axis(ax, label_size=16):
+    """Apply the shared base-map template used by every map panel
+
+    Adds state borders and coastlines (cartopy picks the Natural Earth scale from
+    the map extent), labelled dashed gridlines on the left/bottom only and degree
+    formatters.
+
+    Args:
+        ax (cartopy GeoAxes): map axis
+        label_size (int, optional): tick label font size. Defaults to 16.
+
+    Returns:
+        cartopy Gridliner: the gridliner, for further tweaks
+    """
+    # cartopy is imported on first use so importing a figure module stays cheap
+    import cartopy.crs as ccrs
+    import cartopy.feature as cfeature
+    from cartopy.mpl.ticker import LatitudeFormatter, LongitudeFormatter
+
+    ax.add_feature(cfeature.STATES)
+    ax.coastlines()
+    gl = ax.gridlines(
+        crs=ccrs.PlateCarree(), draw_labels=True,
+        linewidth=1, color='k', alpha=1, linestyle='--')
+    gl.right_labels = None
+    gl.top_labels = None
+    gl.xlines = None
+    gl.ylines = None
+    ax.xaxis.set_major_formatter(LongitudeFormatter(zero_direction_label=True))
+    ax.yaxis.set_major_formatter(LatitudeFormatter())
+    # Increase the ticksize
+    gl.xlabel_style = {'size': label_size, 'color': 'k', 'rotation':30, 'ha':'right'}
+    gl.ylabel_style = {'size': label_size, 'color': 'k', 'weight': 'normal'}
+    return gl
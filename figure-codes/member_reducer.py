@@ -0,0 +1,209 @@
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+SEASONS = ['DJF', 'MAM', 'JJA', 'SON']
+# Month (1-12) -> season index; December joins the DJF of the same calendar year
+MONTH_TO_SEASON = np.array([0, 0, 0, 1, 1, 1, 2, 2, 2, 3, 3, 3, 0])
+
+
+def parse_cesm_filename(path):
+    """Simulation and member from a CESM2-LE timeseries file name
+
+    e.g. b.e21.BHISTcmip6.f09_g17.LE2-1001.001.cam.h1.WSPDSRFAV.19800101-19891231.nc
+
+    Args:
+        path (str): file path
+
+    Returns:
+        tuple: (simulation, member), e.g. ('BHISTcmip6', 'LE2-1001.001')
+    """
+    parts = os.path.basename(path).split('.')
+    # The micro-member suffix (.001-.020) is part of the member id
+    return parts[2], '.'.join(parts[4:6])
+
+
+def group_member_files(files):
+    """Group CESM2-LE files by simulation and member
+
+    Args:
+        files (list): file paths
+
+    Returns:
+        dict: {simulation: {member: sorted list of files}}
+    """
+    grouped = defaultdict(lambda: defaultdict(list))
+    for f in files:
+        sim, member = parse_cesm_filename(f)
+        grouped[sim][member].append(f)
+    return {sim: {m: sorted(fs) for m, fs in members.items()} for sim, members in grouped.items()}
+
+
+def default_period(sim):
+    """Time slice used in the notebooks (drop 2015 from historical, 2100 from projections)"""
+    if 'HIST' in sim:
+        return slice('1978', '2014')
+    return slice(None, '2099')
+
+
+class _MonthlyAccumulator:
+    """Running per-(year, month) sums, counts and maxima of a daily field"""
+
+    def __init__(self):
+        self.sums = {}
+        self.counts = {}
+        self.maxes = {}
+        self.total_sum = None
+        self.total_sumsq = None
+        self.total_count = None
+
+    def add(self, values, years, months):
+        valid = np.isfinite(values)
+        filled = np.where(valid, values, 0).astype('float64')
+        if self.total_sum is None:
+            self.total_sum = np.zeros(values.shape[1:])
+            self.total_sumsq = np.zeros(values.shape[1:])
+            self.total_count = np.zeros(values.shape[1:], dtype='int64')
+        self.total_sum += filled.sum(axis=0)
+        self.total_sumsq += (filled ** 2).sum(axis=0)
+        self.total_count += valid.sum(axis=0)
+        keys = years * 100 + months
+        for key in np.unique(keys):
+            idx = keys == key
+            s = filled[idx].sum(axis=0)
+            c = valid[idx].sum(axis=0)
+            m = np.where(valid[idx], values[idx], -np.inf).max(axis=0)
+            if key in self.sums:
+                self.sums[key] += s
+                self.counts[key] += c
+                np.maximum(self.maxes[key], m, out=self.maxes[key])
+            else:
+                self.sums[key], self.counts[key], self.maxes[key] = s, c, m
+
+    def to_dataset(self, var, lat, lon):
+        keys = np.array(sorted(self.sums))
+        years = np.unique(keys // 100)
+        shape = (len(years), 12) + self.total_sum.shape
+        sums = np.zeros(shape)
+        counts = np.zeros(shape, dtype='int64')
+        maxes = np.full(shape, -np.inf)
+        for key in keys:
+            y, m = np.searchsorted(years, key // 100), key % 100 - 1
+            sums[y, m], counts[y, m], maxes[y, m] = self.sums[key], self.counts[key], self.maxes[key]
+        # Day-count weighted reductions from the monthly running sums
+        seasons = MONTH_TO_SEASON[1:]
+        season_sums = np.stack([sums[:, seasons == s].sum(axis=1) for s in range(4)], axis=1)
+        season_counts = np.stack([counts[:, seasons == s].sum(axis=1) for s in range(4)], axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            monthly = sums / counts
+            seasonal = season_sums / season_counts
+            annual = sums.sum(axis=1) / counts.sum(axis=1)
+        annual_max = maxes.max(axis=1)
+        annual_max[~np.isfinite(annual_max)] = np.nan
+        space = ('lat', 'lon')
+        return xr.Dataset(
+            {
+                f'{var}_annual_mean': (('year',) + space, annual),
+                f'{var}_annual_max': (('year',) + space, annual_max),
+                f'{var}_monthly_mean': (('year', 'month') + space, monthly),
+                f'{var}_seasonal_mean': (('year', 'season') + space, seasonal),
+                f'{var}_ndays': (('year', 'month') + space, counts),
+                f'{var}_sum': (space, self.total_sum),
+                f'{var}_sumsq': (space, self.total_sumsq),
+                f'{var}_count': (space, self.total_count),
+            },
+            coords={'year': years, 'month': np.arange(1, 13), 'season': SEASONS, 'lat': lat, 'lon': lon},
+        )
+
+
+def reduce_member(files, var, period=None, block=365):
+    """Read one member's daily files once and emit every time reduction
+
+    Each file is read ``block`` days at a time, so the raw daily field never has to
+    fit in memory. The running state is not constant, though: one sum (float64),
+    day count (int64) and maximum map is kept per (year, month), about 20 bytes per
+    cell and month, which is the size of the monthly output itself. For the f09 grid
+    that is about 1.1 MB per month, i.e. 13 MB per year of record (about 2 GB for
+    the 1850-2014 historical run), plus one block and, while the dataset is built,
+    a second copy of the monthly arrays.
+
+    Args:
+        files (list): daily timeseries files of one member
+        var (str): variable name, e.g. 'WSPDSRFAV'
+        period (slice, optional): time slice to keep. Defaults to None (all times).
+        block (int, optional): number of days read per step. Defaults to 365.
+
+    Returns:
+        xarray dataset: annual/monthly/seasonal means, annual max, day counts and
+            running sum, sum of squares and count for the climatology
+    """
+    acc = _MonthlyAccumulator()
+    lat = lon = None
+    for f in sorted(files):
+        with xr.open_dataset(f, decode_times=True) as ds:
+            da = ds[var]
+            if period is not None:
+                da = da.sel(time=period)
+            lat, lon = da.lat.values, da.lon.values
+            for start in range(0, da.sizes['time'], block):
+                chunk = da.isel(time=slice(start, start + block))
+                acc.add(
+                    chunk.transpose('time', 'lat', 'lon').values,
+                    chunk.time.dt.year.values,
+                    chunk.time.dt.month.values,
+                )
+    if lat is None or acc.total_sum is None:
+        raise ValueError(f'No {var} data found in {len(files)} files')
+    return acc.to_dataset(var, lat, lon)
+
+
+def _reduce_member_args(args):
+    return reduce_member(*args)
+
+
+def reduce_simulation(member_files, var, period=None, processes=4, block=365):
+    """Reduce every member of a simulation on a local process pool
+
+    Args:
+        member_files (dict): {member: list of files}, e.g. from ``group_member_files``
+        var (str): variable name
+        period (slice, optional): time slice to keep. Defaults to None.
+        processes (int, optional): number of worker processes; memory is about
+            ``processes`` times the per-member state of ``reduce_member``. Defaults to 4.
+        block (int, optional): number of days read per step. Defaults to 365.
+
+    Returns:
+        xarray dataset: reductions stacked along 'realization'
+    """
+    members = sorted(member_files)
+    args = [(member_files[m], var, period, block) for m in members]
+    if processes <= 1:
+        reduced = [_reduce_member_args(a) for a in args]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            reduced = list(pool.map(_reduce_member_args, args))
+    return xr.concat(reduced, pd.Index(members, name='realization'), coords='minimal')
+
+
+def reduce_archive(files, var, processes=4, block=365):
+    """Single-pass reduction of a whole CESM2-LE daily archive
+
+    Args:
+        files (list): all daily files for ``var``, e.g. from glob
+        var (str): variable name
+        processes (int, optional): number of worker processes. Defaults to 4.
+        block (int, optional): number of days read per step. Defaults to 365.
+
+    Returns:
+        dict: {simulation: reduced dataset}
+    """
+    simulations = dict()
+    for sim, member_files in group_member_files(files).items():
+        simulations[sim] = reduce_simulation(
+            member_files, var, period=default_period(sim), processes=processes, block=block
+        )
+    return simulations
@@ -0,0 +1,226 @@
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import pickle
+import shutil
+from dataclasses import dataclass, field
+
+import pandas as pd
+import xarray as xr
+
+from intermediate_store import IntermediateStore
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'winds-of-change', 'pipeline')
+
+
+def files_fingerprint(files):
+    """Hash of a file set: paths, sizes and modification times, or a ``file_index`` index"""
+    h = hashlib.sha1()
+    if isinstance(files, dict) and 'files' in files:
+        entries = sorted((p, e['size'], e['mtime']) for p, e in files['files'].items())
+    else:
+        entries = sorted((p, os.path.getsize(p), os.path.getmtime(p)) for p in files)
+    h.update(json.dumps(entries).encode())
+    return h.hexdigest()[:16]
+
+
+def _source(obj):
+    try:
+        return inspect.getsource(obj)
+    except (OSError, TypeError):
+        return getattr(obj, '__qualname__', getattr(obj, '__name__', repr(obj)))
+
+
+def _code_version(func, version, modules=()):
+    """Hash of the node function, its explicit version and the helper modules it relies on"""
+    h = hashlib.sha1(f'{version}\n{_source(func)}'.encode())
+    for name in sorted(modules):
+        h.update(_source(importlib.import_module(name)).encode())
+    return h.hexdigest()[:16]
+
+
+@dataclass
+class Node:
+    """A derived product: ``func(*inputs, **params)``"""
+
+    name: str
+    func: callable
+    inputs: tuple = ()
+    params: dict = field(default_factory=dict)
+    version: str = '1'
+    files: object = None  # paths, a file_index index, or a callable returning either
+    modules: tuple = ()  # helper modules whose source is part of the key, e.g. ('anomalies',)
+
+
+class Pipeline:
+    """Content-addressed DAG of derived products with an on-disk cache
+
+    Each node's key is a hash of its code, parameters, input files and the keys of
+    its input nodes, so a key changes when something upstream changed. Only the
+    node function's own source is hashed automatically: list the helper modules it
+    calls (``anomalies``, ``return_levels``, ...) in ``modules`` so edits to them
+    invalidate the node, or bump ``version`` by hand when other code changes.
+
+    Outputs are stored under ``{name}-{key}``: xarray products as Zarr stores
+    (opened lazily downstream), DataFrames as parquet and anything else as pickle,
+    each written to a temporary name and renamed into place. ``run`` recomputes
+    only nodes whose key has no stored output, so changing a plot or a reference
+    period never rereads the daily archives. Keys are recomputed on every ``run``,
+    so helper edits are picked up by a long-lived pipeline too.
+
+        pipe = Pipeline()
+
+        @pipe.node(files=lambda: glob('/glade/.../*WSPDSRFAV*.nc'))
+        def monthly(): ...
+
+        @pipe.node(inputs=('monthly',), params={'period': (1978, 2014)}, modules=('anomalies',))
+        def anomalies(monthly, period): ...
+
+        pipe.run('anomalies')
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.store = IntermediateStore(cache_dir)
+        self.nodes = dict()
+        self._keys = dict()
+
+    def add(self, name, func, inputs=(), params=None, version='1', files=None, modules=()):
+        """Declare a node; inputs must already be declared"""
+        missing = [i for i in inputs if i not in self.nodes]
+        if missing:
+            raise KeyError(f'Unknown inputs of {name}: {missing}')
+        self.nodes[name] = Node(name, func, tuple(inputs), dict(params or {}), version, files, tuple(modules))
+        self._keys.clear()
+        return self.nodes[name]
+
+    def node(self, name=None, inputs=(), params=None, version='1', files=None, modules=()):
+        """Decorator form of ``add``; the node name defaults to the function name"""
+        def decorator(func):
+            self.add(name or func.__name__, func, inputs, params, version, files, modules)
+            return func
+        return decorator
+
+    def set_params(self, name, **params):
+        """Change parameters of a node (invalidates it and everything downstream)"""
+        self.nodes[name].params.update(params)
+        self._keys.clear()
+
+    def key(self, name):
+        """Content hash of a node, memoized until the next ``run``, ``status`` or ``prune``"""
+        if name not in self._keys:
+            node = self.nodes[name]
+            files = node.files() if callable(node.files) else node.files
+            h = hashlib.sha1()
+            h.update(name.encode())
+            h.update(_code_version(node.func, node.version, node.modules).encode())
+            h.update(json.dumps(node.params, sort_keys=True, default=repr).encode())
+            h.update(b'' if files is None else files_fingerprint(files).encode())
+            for i in node.inputs:
+                h.update(self.key(i).encode())
+            self._keys[name] = h.hexdigest()[:16]
+        return self._keys[name]
+
+    def _path(self, name, suffix):
+        return os.path.join(self.cache_dir, f'{name}-{self.key(name)}{suffix}')
+
+    def _stored(self, name):
+        entry = f'{name}-{self.key(name)}'
+        if entry in self.store:
+            return 'zarr'
+        for kind, suffix in (('parquet', '.parquet'), ('pickle', '.pkl')):
+            if os.path.exists(self._path(name, suffix)):
+                return kind
+        return None
+
+    def is_fresh(self, name):
+        return self._stored(name) is not None
+
+    def status(self):
+        """{node: 'fresh' | 'stale'} for every declared node"""
+        self._keys.clear()
+        return {name: 'fresh' if self.is_fresh(name) else 'stale' for name in self.nodes}
+
+    def _load(self, name, kind):
+        if kind == 'zarr':
+            ds = self.store.open(f'{name}-{self.key(name)}')
+            if ds.attrs.get('_pipeline_dataarray'):
+                return ds[ds.attrs['_pipeline_dataarray']]
+            return ds
+        if kind == 'parquet':
+            return pd.read_parquet(self._path(name, '.parquet'))
+        with open(self._path(name, '.pkl'), 'rb') as f:
+            return pickle.load(f)
+
+    def _save(self, name, value):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if isinstance(value, (xr.Dataset, xr.DataArray)):
+            if isinstance(value, xr.DataArray):
+                value = value.rename(value.name or name)
+                value = value.to_dataset().assign_attrs(_pipeline_dataarray=value.name)
+            # Write under a temporary key and rename, so a killed run never leaves a
+            # partial store that _stored would report as fresh
+            entry = f'{name}-{self.key(name)}'
+            tmp = f'{entry}.{os.getpid()}.tmp'
+            self.store.write(tmp, value)
+            if entry in self.store:
+                shutil.rmtree(self.store.path(entry))
+            os.replace(self.store.path(tmp), self.store.path(entry))
+            return
+        if isinstance(value, pd.DataFrame):
+            path = self._path(name, '.parquet')
+            tmp = f'{path}.{os.getpid()}.tmp'
+            value.to_parquet(tmp)
+        else:
+            path = self._path(name, '.pkl')
+            tmp = f'{path}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                pickle.dump(value, f)
+        os.replace(tmp, path)
+
+    def run(self, name, force=False):
+        """Output of a node, recomputing it (and stale inputs) only if needed
+
+        Args:
+            name (str): node name
+            force (bool, optional): Whether to recompute this node even if cached. Defaults to False.
+
+        Returns:
+            object: the product; xarray products are opened lazily from the cache
+        """
+        # Keys are recomputed on every call: helper modules or input files may have
+        # changed since the last run of a long-lived pipeline
+        self._keys.clear()
+        return self._run(name, force)
+
+    def _run(self, name, force=False):
+        kind = None if force else self._stored(name)
+        if kind is None:
+            node = self.nodes[name]
+            inputs = [self._run(i) for i in node.inputs]
+            self._save(name, node.func(*inputs, **node.params))
+            kind = self._stored(name)
+        return self._load(name, kind)
+
+    def prune(self):
+        """Delete stored outputs that no current node key refers to
+
+        Leftovers of interrupted writes (``*.tmp*``) are deleted too, so do not prune
+        while another process is running the pipeline on the same cache.
+        """
+        self._keys.clear()
+        current = {f'{name}-{self.key(name)}' for name in self.nodes}
+        if not os.path.isdir(self.cache_dir):
+            return
+        for entry in os.listdir(self.cache_dir):
+            stem, suffix = os.path.splitext(entry)
+            partial = '.tmp' in entry
+            if not partial and (suffix not in ('.zarr', '.parquet', '.pkl') or stem in current):
+                continue
+            path = os.path.join(self.cache_dir, entry)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
@@ -0,0 +1,221 @@
+import functools
+import json
+import logging
+import os
+import resource
+import time
+from contextlib import contextmanager
+
+# Same layout as logs/station_extract.log
+LOG_FORMAT = '%(asctime)s.%(msecs)03d %(levelname)s %(name)s - %(funcName)s: %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+COLUMNS = ('stage', 'seconds', 'read_mb', 'tasks', 'peak_mb', 'scope', 'spilled_mb')
+
+
+def setup_logging(path=None, name='pipeline', level=logging.INFO):
+    """Logger writing in the station_extract.log format (to ``path`` or stderr)
+
+    Calling it again with the same destination reuses the existing handler, so
+    repeated runs in one process do not duplicate log lines.
+    """
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+    target = os.path.abspath(path) if path else None
+    for h in logger.handlers:
+        if target is not None and isinstance(h, logging.FileHandler) and h.baseFilename == target:
+            return logger
+        if target is None and type(h) is logging.StreamHandler:
+            return logger
+    handler = logging.FileHandler(path) if path else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT, DATE_FORMAT))
+    logger.addHandler(handler)
+    return logger
+
+
+def _read_bytes():
+    """Bytes this process has read from storage (None where /proc is unavailable)"""
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('read_bytes:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _max_rss():
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _spilled_total(dask_worker):
+    """Bytes this worker has written to disk since it started (cumulative)
+
+    Spill writes are metered as ('...', 'disk-write', 'bytes') digests; the spill
+    buffer's ``spilled_total`` is only the amount currently on disk.
+    """
+    digests = getattr(dask_worker, 'digests_total', None)
+    if not digests:
+        return None
+    return sum(
+        v for k, v in digests.items()
+        if isinstance(k, tuple) and len(k) >= 2 and k[-2:] == ('disk-write', 'bytes')
+    )
+
+
+def _worker_snapshot(dask_worker):
+    """Counters of one distributed worker; fields the installed version lacks are None"""
+    state = getattr(dask_worker, 'state', None)
+    return {
+        'read_bytes': _read_bytes(),
+        'tasks': getattr(state, 'executed_count', None),
+        'spilled_bytes': _spilled_total(dask_worker),
+    }
+
+
+def _sum(snapshots, key):
+    values = [s[key] for s in snapshots.values() if s.get(key) is not None]
+    return sum(values) if values else None
+
+
+def _delta(before, after):
+    return None if before is None or after is None else after - before
+
+
+class _TaskCounter:
+    """Counts tasks run by the local (threads/synchronous) dask schedulers"""
+
+    def __init__(self):
+        from dask.callbacks import Callback
+
+        counter = self
+
+        class _Callback(Callback):
+            def _posttask(self, key, result, dsk, state, worker_id):
+                counter.count += 1
+
+        self.count = 0
+        self.callback = _Callback()
+
+
+class StageProfiler:
+    """Wall time, I/O, tasks, memory and spill per pipeline stage
+
+        profiler = StageProfiler(client=client)
+        with profiler.stage('cmip6_extract'):
+            points = index.extract(data).compute()
+        profiler.write('logs/trace.json')
+        print(profiler.summary())
+
+    With a distributed client, disk reads, executed tasks and spilled bytes are
+    summed over the workers, and the memory figure is the peak of the whole
+    cluster's process memory (summed over workers) from dask's MemorySampler.
+    Without one, the same figures come from this process, a local scheduler
+    callback and the process high-water mark. Each record says which in
+    'memory_scope' ('cluster' or 'process').
+    """
+
+    def __init__(self, client=None, logger='pipeline'):
+        self.client = client
+        self.logger = logging.getLogger(logger) if isinstance(logger, str) else logger
+        self.records = []
+
+    def _snapshot(self):
+        if self.client is None:
+            return {'read_bytes': _read_bytes(), 'tasks': None, 'spilled_bytes': None}
+        workers = self.client.run(_worker_snapshot)
+        return {key: _sum(workers, key) for key in ('read_bytes', 'tasks', 'spilled_bytes')}
+
+    @contextmanager
+    def stage(self, name, **info):
+        """Record one stage; extra keyword arguments are stored with the record"""
+        before = self._snapshot()
+        rss_before = _max_rss()
+        counter = sampler = None
+        if self.client is None:
+            try:
+                counter = _TaskCounter()
+                counter.callback.register()
+            except ImportError:
+                counter = None
+        else:
+            from distributed.diagnostics import MemorySampler
+
+            sampler = MemorySampler()
+        self.logger.info(f'{name}: started')
+        start = time.perf_counter()
+        started_at = time.time()
+        try:
+            if sampler is not None:
+                with sampler.sample(name, client=self.client, measure='process'):
+                    yield
+            else:
+                yield
+        finally:
+            seconds = time.perf_counter() - start
+            if counter is not None:
+                counter.callback.unregister()
+            after = self._snapshot()
+            if sampler is not None:
+                samples = sampler.to_pandas()
+                peak = float(samples[name].max()) if name in samples and len(samples) else None
+            else:
+                # Process high-water mark, only meaningful if the stage raised it
+                peak = _max_rss() if _max_rss() > rss_before else None
+            record = {
+                'stage': name,
+                'start': started_at,
+                'seconds': seconds,
+                'read_bytes': _delta(before['read_bytes'], after['read_bytes']),
+                'tasks': counter.count if counter is not None else _delta(before['tasks'], after['tasks']),
+                'peak_memory': peak,
+                'memory_scope': 'cluster' if self.client is not None else 'process',
+                'spilled_bytes': _delta(before['spilled_bytes'], after['spilled_bytes']),
+                'backend': 'distributed' if self.client is not None else 'local',
+                **info,
+            }
+            self.records.append(record)
+            self.logger.info(f'{name}: {seconds:.1f}s, {_mb(record["read_bytes"])} MB read, {record["tasks"]} tasks')
+
+    def wrap(self, name=None):
+        """Decorator profiling every call of a function as a stage"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(name or func.__name__):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def write(self, path):
+        """Write the trace as JSON"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.records, f, indent=1)
+
+    def summary(self):
+        """Fixed-width table of the recorded stages ('scope' says whether peak_mb is per process or cluster-wide)"""
+        rows = [COLUMNS]
+        for r in self.records:
+            rows.append((
+                r['stage'], f"{r['seconds']:.1f}", _mb(r['read_bytes']), _value(r['tasks']),
+                _mb(r['peak_memory']), r['memory_scope'], _mb(r['spilled_bytes']),
+            ))
+        widths = [max(len(str(row[i])) for row in rows) for i in range(len(COLUMNS))]
+        lines = ['  '.join(str(v).rjust(w) if i else str(v).ljust(w) for i, (v, w) in enumerate(zip(row, widths))) for row in rows]
+        return '\n'.join(lines)
+
+
+def _mb(value):
+    return '-' if value is None else f'{value / 2**20:.1f}'
+
+
+def _value(value):
+    return '-' if value is None else str(value)
+
+
+def load_trace(path):
+    with open(path) as f:
+        return json.load(f)
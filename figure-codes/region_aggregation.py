@@ -0,0 +1,123 @@
+import numpy as np
+import scipy.sparse
+import xarray as xr
+
+
+def normalize_columns(matrix):
+    # Each region column sums to one so the matmul is a weighted mean
+    totals = np.asarray(matrix.sum(axis=0)).ravel()
+    totals[totals == 0] = 1
+    return (matrix @ scipy.sparse.diags(1 / totals)).tocsr()
+
+
+class RegionAggregator:
+    """Area-weighted cell -> region reduction as one sparse matrix multiply
+
+    The (lat*lon, region) weight matrix is built once per grid and region set and
+    can be reused for every scenario, member and variable on that grid. A
+    (time, member, lat, lon) array reduces to (time, member, region) in a single
+    pass over the data, so hundreds of regions cost the same I/O as one.
+    """
+
+    def __init__(self, matrix, lat, lon, numbers, names=None):
+        self.matrix = matrix.tocsr()
+        self.lat = np.asarray(lat)
+        self.lon = np.asarray(lon)
+        self.numbers = np.asarray(numbers)
+        self.names = None if names is None else np.asarray(names)
+
+    @classmethod
+    def from_mask(cls, mask, weights='coslat', names=None):
+        """Build from a 2D (lat, lon) mask of region numbers (NaN outside)
+
+        Args:
+            mask (xarray DataArray): e.g. from ``regionmask.mask_geopandas``
+            weights (str or None, optional): 'coslat' for area weights, None for equal weights. Defaults to 'coslat'.
+            names (dict, optional): mapping of region number to name. Defaults to None.
+
+        Returns:
+            RegionAggregator: aggregator for the mask grid
+        """
+        mask = mask.transpose('lat', 'lon')
+        values = mask.values.ravel()
+        cells = np.flatnonzero(np.isfinite(values))
+        numbers, column = np.unique(values[cells], return_inverse=True)
+        if weights == 'coslat':
+            w = np.broadcast_to(np.cos(np.deg2rad(mask.lat.values))[:, None], mask.shape).ravel()[cells]
+        else:
+            w = np.ones(len(cells))
+        matrix = scipy.sparse.csr_matrix((w, (cells, column)), shape=(values.size, len(numbers)))
+        if names is not None:
+            names = [names.get(n, str(n)) for n in numbers]
+        return cls(normalize_columns(matrix), mask.lat, mask.lon, numbers, names)
+
+    @classmethod
+    def from_geopandas(cls, gdf, lon, lat, numbers, names=None, method='coslat'):
+        """Build from polygons in a GeoDataFrame
+
+        Args:
+            gdf (geopandas GeoDataFrame): region polygons, e.g. balancing authorities
+            lon (xarray DataArray): longitude coordinate
+            lat (xarray DataArray): latitude coordinate
+            numbers (str): column with region numbers
+            names (str, optional): column with region names. Defaults to None.
+            method (str, optional): 'coslat' for cos-latitude weighted cell centres,
+                'fraction' for cos-latitude times fractional overlap. Defaults to 'coslat'.
+
+        Returns:
+            RegionAggregator: aggregator for the lon/lat grid
+        """
+        import regionmask
+
+        name_map = None if names is None else dict(zip(gdf[numbers], gdf[names]))
+        if method == 'coslat':
+            mask = regionmask.mask_geopandas(gdf, lon, lat, numbers=numbers, overlap=False)
+            return cls.from_mask(mask, weights='coslat', names=name_map)
+        if method != 'fraction':
+            raise ValueError(f'Unknown weighting method: {method}')
+        regions = regionmask.from_geopandas(gdf, numbers=numbers, names=names, overlap=False)
+        frac = regions.mask_3D_frac_approx(lon, lat).transpose('region', 'lat', 'lon')
+        coslat = np.cos(np.deg2rad(frac.lat.values))[None, :, None]
+        w = (frac.values * coslat).reshape(len(frac.region), -1).T
+        matrix = scipy.sparse.csr_matrix(np.where(np.isfinite(w), w, 0))
+        region_names = None if name_map is None else [name_map[n] for n in frac.region.values]
+        return cls(normalize_columns(matrix), frac.lat, frac.lon, frac.region.values, region_names)
+
+    def _reduce(self, block):
+        shape = block.shape[:-2]
+        flat = block.reshape(-1, block.shape[-2] * block.shape[-1])
+        valid = np.isfinite(flat)
+        # Renormalize by the weight of the cells that have data
+        total = (self.matrix.T @ np.where(valid, flat, 0).T).T
+        weight = (self.matrix.T @ valid.T.astype(float)).T
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out = total / weight
+        return out.reshape(shape + (len(self.numbers),))
+
+    def __call__(self, data):
+        """Reduce the lat/lon dimensions of ``data`` onto 'region'
+
+        Args:
+            data (xarray DataArray or Dataset): data on the aggregator grid, may be dask-backed
+
+        Returns:
+            xarray DataArray or Dataset: data with (lat, lon) replaced by 'region'
+        """
+        np.testing.assert_allclose(data.lat.values, self.lat)
+        np.testing.assert_allclose(data.lon.values, self.lon)
+        # Spatial dimensions must be a single chunk for the matmul
+        if data.chunks:
+            data = data.chunk({'lat': -1, 'lon': -1})
+        result = xr.apply_ufunc(
+            self._reduce,
+            data,
+            input_core_dims=[['lat', 'lon']],
+            output_core_dims=[['region']],
+            dask='parallelized',
+            output_dtypes=[float],
+            dask_gufunc_kwargs={'output_sizes': {'region': len(self.numbers)}},
+        )
+        result = result.assign_coords(region=self.numbers)
+        if self.names is not None:
+            result = result.assign_coords(region_name=('region', self.names))
+        return result
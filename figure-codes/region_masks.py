@@ -0,0 +1,255 @@
+import hashlib
+import os
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import xarray as xr
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'winds-of-change', 'region-masks')
+
+# id(region map) -> (weak reference, fingerprint); entries go away with the map
+_fingerprints = dict()
+
+
+def grid_fingerprint(lat, lon):
+    """Short hash identifying a lat/lon grid
+
+    Args:
+        lat (array-like): latitude values
+        lon (array-like): longitude values
+
+    Returns:
+        str: hex digest of the grid coordinates
+    """
+    h = hashlib.sha1()
+    for coord in (lat, lon):
+        values = np.ascontiguousarray(np.asarray(coord, dtype='float64'))
+        h.update(str(values.shape).encode())
+        h.update(values.tobytes())
+    return h.hexdigest()[:16]
+
+
+def regions_fingerprint(map):
+    """Short hash identifying a region set by its numbers and polygon geometry
+
+    The name of a regionmask object is not enough: every ``from_geopandas`` object
+    without an explicit name is called 'unnamed'. The polygons are hashed once per
+    region object; later lookups with the same object are a dictionary hit.
+
+    Args:
+        map (regionmask): regionmask object
+
+    Returns:
+        str: hex digest of the region numbers and polygons
+    """
+    key = id(map)
+    if key in _fingerprints:
+        ref, fingerprint = _fingerprints[key]
+        if ref() is map:
+            return fingerprint
+    h = hashlib.sha1()
+    h.update(np.ascontiguousarray(np.asarray(map.numbers, dtype='int64')).tobytes())
+    for polygon in map.polygons:
+        h.update(polygon.wkb)
+    fingerprint = h.hexdigest()[:16]
+    try:
+        ref = weakref.ref(map, lambda _, key=key: _fingerprints.pop(key, None))
+    except TypeError:
+        return fingerprint
+    _fingerprints[key] = (ref, fingerprint)
+    return fingerprint
+
+
+def region_keys(map, regions=None):
+    """Region numbers for a list of region names (case insensitive)
+
+    Args:
+        map (regionmask): regionmask object
+        regions (list or None): list of region names. if None, all regions are taken. Defaults to None.
+
+    Returns:
+        list: region numbers
+    """
+    id_dict = map.region_ids
+    if regions is None:
+        return list(map.numbers)
+    regions_upper = [region.upper() for region in regions]
+    names = [name for name in id_dict.keys() if str(name).upper() in regions_upper]
+    assert len(names) == len(regions), 'Not enough regions found'
+    return [id_dict[name] for name in names]
+
+
+class RegionMaskCache:
+    """LRU cache of rasterized region masks, persisted to disk
+
+    Masks are keyed by the region set and the grid fingerprint, so the polygon
+    rasterization for a given (regions, grid) pair runs once per machine. Flat cell
+    indices for region subsets are memoized as well, which turns repeated regional
+    subsets into an integer gather.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, maxsize=32):
+        self.cache_dir = cache_dir
+        self.maxsize = maxsize
+        self._masks = OrderedDict()
+        self._indices = OrderedDict()
+
+    def _key(self, map, lat, lon):
+        name = ''.join(c if c.isalnum() else '_' for c in str(map.name))
+        return f'{name}-{regions_fingerprint(map)}-{grid_fingerprint(lat, lon)}'
+
+    def _remember(self, store, key, value):
+        store[key] = value
+        store.move_to_end(key)
+        while len(store) > self.maxsize:
+            store.popitem(last=False)
+
+    def mask(self, map, lat, lon):
+        """Region-number mask (NaN outside all regions) on a lat/lon grid
+
+        Args:
+            map (regionmask): regionmask object
+            lat (xarray DataArray): latitude coordinate
+            lon (xarray DataArray): longitude coordinate
+
+        Returns:
+            xarray DataArray: (lat, lon) mask of region numbers
+        """
+        key = self._key(map, lat, lon)
+        if key in self._masks:
+            self._masks.move_to_end(key)
+            return self._masks[key]
+        path = os.path.join(self.cache_dir, key + '.npy') if self.cache_dir else None
+        if path is not None and os.path.exists(path):
+            values = np.load(path)
+        else:
+            values = map.mask(lon, lat).transpose('lat', 'lon').values
+            if path is not None:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                # Write then rename so concurrent workers never read a partial file
+                tmp = f'{path}.{os.getpid()}.tmp.npy'
+                np.save(tmp, values)
+                os.replace(tmp, path)
+        mask = xr.DataArray(
+            values,
+            dims=('lat', 'lon'),
+            coords={'lat': np.asarray(lat), 'lon': np.asarray(lon)},
+            name='mask',
+        )
+        self._remember(self._masks, key, mask)
+        return mask
+
+    def index(self, map, lat, lon, regions=None, reverse=False):
+        """Flat (row-major lat, lon) indices of the cells covered by ``regions``
+
+        Args:
+            map (regionmask): regionmask object
+            lat (xarray DataArray): latitude coordinate
+            lon (xarray DataArray): longitude coordinate
+            regions (list or None): list of region names. if None, all regions are taken. Defaults to None.
+            reverse (bool, optional): Whether to index the inverse of the regions. Defaults to False.
+
+        Returns:
+            numpy array: integer cell indices
+        """
+        keys = region_keys(map, regions)
+        key = (self._key(map, lat, lon), tuple(sorted(keys)), reverse)
+        if key in self._indices:
+            self._indices.move_to_end(key)
+            return self._indices[key]
+        inside = np.isin(self.mask(map, lat, lon).values, keys)
+        if reverse:
+            inside = ~inside
+        cells = np.flatnonzero(inside)
+        self._remember(self._indices, key, cells)
+        return cells
+
+    def clear(self, disk=False):
+        """Empty the in-memory cache (and optionally the on-disk cache)"""
+        self._masks.clear()
+        self._indices.clear()
+        if disk and self.cache_dir and os.path.isdir(self.cache_dir):
+            for f in os.listdir(self.cache_dir):
+                if f.endswith('.npy'):
+                    os.remove(os.path.join(self.cache_dir, f))
+
+
+default_cache = RegionMaskCache()
+
+
+def mask_data(data, map, regions: None, drop=False, reverse=False, cache=None):
+    """Mask xarray data based on region names, reusing cached masks
+
+    Args:
+        data (xarray dataset): xarray dataset to mask
+        map (regionmask): regionmask object
+        regions (list or None): list of region names to mask. if None, all regions are taken. Defaults to None.
+        drop (bool, optional): Whether to drop when masking. Defaults to False.
+        reverse (bool, optional): Whether to mask the inverse of the regions. Defaults to False.
+        cache (RegionMaskCache, optional): mask cache. Defaults to the module cache.
+
+    Returns:
+        xarray dataset: masked dataset
+    """
+    cache = default_cache if cache is None else cache
+    cells = cache.index(map, data.lat, data.lon, regions, reverse=reverse)
+    nlat, nlon = len(data.lat), len(data.lon)
+    inside = np.zeros(nlat * nlon, dtype=bool)
+    inside[cells] = True
+    inside = inside.reshape(nlat, nlon)
+    if drop:
+        # Crop to the bounding box of the selected cells by integer indexing
+        rows = np.flatnonzero(inside.any(axis=1))
+        cols = np.flatnonzero(inside.any(axis=0))
+        data = data.isel(lat=rows, lon=cols)
+        inside = inside[np.ix_(rows, cols)]
+    keep = xr.DataArray(inside, dims=('lat', 'lon'), coords={'lat': data.lat, 'lon': data.lon})
+    return data.where(keep)
+
+
+def _gather(data, cells):
+    rows, cols = np.unravel_index(cells, (len(data.lat), len(data.lon)))
+    return data.isel(
+        lat=xr.DataArray(rows, dims='cell'),
+        lon=xr.DataArray(cols, dims='cell'),
+    )
+
+
+def subset_cells(data, map, regions=None, reverse=False, cache=None):
+    """Gather only the cells inside ``regions`` onto a flat 'cell' dimension
+
+    Unlike ``mask_data`` no NaN padding is kept, so reductions over 'cell' touch only
+    cells inside the region. lat and lon are kept as coordinates on 'cell'.
+
+    Args:
+        data (xarray dataset): xarray dataset to subset
+        map (regionmask): regionmask object
+        regions (list or None): list of region names. if None, all regions are taken. Defaults to None.
+        reverse (bool, optional): Whether to take the inverse of the regions. Defaults to False.
+        cache (RegionMaskCache, optional): mask cache. Defaults to the module cache.
+
+    Returns:
+        xarray dataset: data with (lat, lon) replaced by 'cell'
+    """
+    cache = default_cache if cache is None else cache
+    return _gather(data, cache.index(map, data.lat, data.lon, regions, reverse=reverse))
+
+
+def conus_cells(data, cache=None):
+    """Cells of the contiguous US (us_states_50 without Alaska and Hawaii)
+
+    Args:
+        data (xarray dataset): xarray dataset to subset
+        cache (RegionMaskCache, optional): mask cache. Defaults to the module cache.
+
+    Returns:
+        xarray dataset: data on a flat 'cell' dimension
+    """
+    import regionmask
+
+    cache = default_cache if cache is None else cache
+    states = regionmask.defined_regions.natural_earth_v5_0_0.us_states_50
+    all_states = cache.index(states, data.lat, data.lon, None)
+    non_conus = cache.index(states, data.lat, data.lon, ['alaska', 'hawaii'])
+    return _gather(data, np.setdiff1d(all_states, non_conus))
@@ -0,0 +1,164 @@
+from dataclasses import dataclass
+
+import numpy as np
+import xarray as xr
+
+from region_masks import default_cache
+
+# Around 100 MB per chunk, the size the notebooks aimed for with {'time': 365}
+TARGET_CHUNK_BYTES = 100 * 2**20
+
+
+@dataclass
+class Footprint:
+    """Bounding-box index slices plus the cells of a region on one grid"""
+
+    lat_slice: slice
+    lon_slice: slice
+    inside: np.ndarray  # (lat, lon) boolean, relative to the bounding box
+    name: str = None
+
+    def __str__(self):
+        if self.name is not None:
+            return self.name
+        return (f'bounding box lat[{self.lat_slice.start}:{self.lat_slice.stop}] '
+                f'lon[{self.lon_slice.start}:{self.lon_slice.stop}]')
+
+    @property
+    def shape(self):
+        return self.inside.shape
+
+    @property
+    def n_cells(self):
+        return int(self.inside.sum())
+
+    def time_chunk(self, itemsize=4, target_bytes=TARGET_CHUNK_BYTES, min_days=30, max_days=3650):
+        """Time chunk length that gives ~``target_bytes`` chunks over the bounding box
+
+        Small regions get long time chunks (few tasks), large ones short chunks.
+        """
+        days = target_bytes // max(self.shape[0] * self.shape[1] * itemsize, 1)
+        return int(np.clip(days, min_days, max_days))
+
+    def subset(self, ds):
+        """Crop to the bounding box and mask cells outside the region, lazily"""
+        ds = ds.isel(lat=self.lat_slice, lon=self.lon_slice)
+        keep = xr.DataArray(self.inside, dims=('lat', 'lon'), coords={'lat': ds.lat, 'lon': ds.lon})
+        return ds.where(keep)
+
+
+def _from_inside(inside):
+    rows = np.flatnonzero(inside.any(axis=1))
+    cols = np.flatnonzero(inside.any(axis=0))
+    if len(rows) == 0:
+        raise ValueError('Region does not cover any grid cell')
+    lat_slice = slice(rows[0], rows[-1] + 1)
+    lon_slice = slice(cols[0], cols[-1] + 1)
+    return Footprint(lat_slice, lon_slice, inside[lat_slice, lon_slice])
+
+
+def footprint(map, lat, lon, regions=None, reverse=False, lat_bounds=None, exclude=None, cache=None):
+    """Footprint of a set of regions on a grid
+
+    Args:
+        map (regionmask): regionmask object
+        lat (xarray DataArray): latitude coordinate
+        lon (xarray DataArray): longitude coordinate
+        regions (list or None): region names. if None, all regions are taken. Defaults to None.
+        reverse (bool, optional): Whether to take the inverse of the regions. Defaults to False.
+        lat_bounds (tuple, optional): (south, north) band to keep, replacing ``where(lat > -59).compute()``. Defaults to None.
+        exclude (tuple, optional): (map, regions) removed from the footprint, e.g. Greenland. Defaults to None.
+        cache (RegionMaskCache, optional): mask cache. Defaults to the module cache.
+
+    Returns:
+        Footprint: bounding box slices and cells
+    """
+    cache = default_cache if cache is None else cache
+    shape = (len(lat), len(lon))
+    inside = np.zeros(shape[0] * shape[1], dtype=bool)
+    inside[cache.index(map, lat, lon, regions, reverse=reverse)] = True
+    if exclude is not None:
+        inside[cache.index(exclude[0], lat, lon, exclude[1])] = False
+    inside = inside.reshape(shape)
+    if lat_bounds is not None:
+        lat_values = np.asarray(lat)
+        inside &= ((lat_values > lat_bounds[0]) & (lat_values < lat_bounds[1]))[:, None]
+    return _from_inside(inside)
+
+
+def named_footprint(name, lat, lon, cache=None):
+    """Footprints of the regions used throughout the notebooks
+
+    Args:
+        name (str): 'conus', 'us_states' or 'land' (land without Greenland, 59S-70N)
+        lat (xarray DataArray): latitude coordinate
+        lon (xarray DataArray): longitude coordinate
+        cache (RegionMaskCache, optional): mask cache. Defaults to the module cache.
+
+    Returns:
+        Footprint: bounding box slices and cells
+    """
+    import regionmask
+
+    natural_earth = regionmask.defined_regions.natural_earth_v5_0_0
+    if name == 'conus':
+        states = natural_earth.us_states_50
+        fp = footprint(states, lat, lon, exclude=(states, ['alaska', 'hawaii']), cache=cache)
+    elif name == 'us_states':
+        fp = footprint(natural_earth.us_states_50, lat, lon, cache=cache)
+    elif name == 'land':
+        fp = footprint(
+            natural_earth.land_110, lat, lon, ['land'],
+            exclude=(natural_earth.countries_110, ['greenland']),
+            lat_bounds=(-59, 70), cache=cache,
+        )
+    else:
+        raise ValueError(f'Unknown region: {name}')
+    fp.name = name
+    return fp
+
+
+def geopandas_footprint(gdf, lat, lon, numbers):
+    """Footprint of all polygons in a GeoDataFrame (e.g. balancing authorities)"""
+    import regionmask
+
+    mask = regionmask.mask_geopandas(gdf, lon, lat, numbers=numbers, overlap=False)
+    return _from_inside(np.isfinite(mask.transpose('lat', 'lon').values))
+
+
+def open_region(files, var, fp, time=None, time_chunk=None):
+    """Open daily files reading only the chunks that overlap a region
+
+    Each file is opened lazily and cropped to the footprint's bounding box before
+    dask chunking, so reads never touch cells outside the box. Time chunks are sized
+    from the footprint instead of a fixed 365.
+
+    Args:
+        files (list): NetCDF files of one member, in time order
+        var (str): variable to read
+        fp (Footprint): region footprint on the files' grid
+        time (slice, optional): time slice to keep. Defaults to None.
+        time_chunk (int, optional): time chunk length. Defaults to ``fp.time_chunk()``.
+
+    Returns:
+        xarray DataArray: masked regional data
+    """
+    pieces = []
+    chunk = time_chunk
+    for f in sorted(files):
+        ds = xr.open_dataset(f, chunks=None)[[var]]
+        ds = ds.isel(lat=fp.lat_slice, lon=fp.lon_slice)
+        if time is not None:
+            ds = ds.sel(time=time)
+        if not ds.sizes['time']:
+            continue
+        if chunk is None:
+            chunk = fp.time_chunk(itemsize=ds[var].dtype.itemsize)
+        # Chunking after the crop wraps only the cropped region in dask
+        pieces.append(ds.chunk({'time': chunk}))
+    if not pieces:
+        period = f'{time.start} to {time.stop}' if isinstance(time, slice) else ('any time' if time is None else time)
+        raise ValueError(f'No data for region {fp} in {period} in {len(files)} files of {var}')
+    ds = xr.concat(pieces, 'time').chunk({'time': chunk, 'lat': -1, 'lon': -1})
+    keep = xr.DataArray(fp.inside, dims=('lat', 'lon'), coords={'lat': ds.lat, 'lon': ds.lon})
+    return ds[var].where(keep)
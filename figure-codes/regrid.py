@@ -0,0 +1,175 @@
+import os
+from collections import OrderedDict
+
+import numpy as np
+import scipy.sparse
+import xarray as xr
+
+from region_masks import grid_fingerprint
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'winds-of-change', 'regrid-weights')
+METHODS = ('bilinear', 'conservative')
+
+
+def _bounds(centers):
+    centers = np.asarray(centers, dtype=float)
+    mid = (centers[1:] + centers[:-1]) / 2
+    return np.concatenate([[2 * centers[0] - mid[0]], mid, [2 * centers[-1] - mid[-1]]])
+
+
+def _overlap(src_bounds, dst_bounds):
+    """(dst, src) lengths of the overlap of 1D cells"""
+    lo = np.maximum(dst_bounds[:-1, None], src_bounds[None, :-1])
+    hi = np.minimum(dst_bounds[1:, None], src_bounds[None, 1:])
+    return np.clip(hi - lo, 0, None)
+
+
+def conservative_weights(src_lat, src_lon, dst_lat, dst_lon):
+    """First-order conservative remap weights between rectilinear lat/lon grids
+
+    Cell overlaps are separable on a lat/lon grid: latitude overlaps are measured
+    in sin(latitude) (true area), longitude overlaps periodically, and the 2D
+    weights are their Kronecker product. Rows are normalized by the covered area
+    so destination cells partly outside the source grid are still means.
+
+    Returns:
+        scipy.sparse.csr_matrix: (dst lat*lon, src lat*lon) weights
+    """
+    src_lat_b = np.sin(np.deg2rad(np.clip(_bounds(src_lat), -90, 90)))
+    dst_lat_b = np.sin(np.deg2rad(np.clip(_bounds(dst_lat), -90, 90)))
+    lat_w = _overlap(np.sort(src_lat_b), np.sort(dst_lat_b))
+    # Undo the sorting for descending latitude axes
+    if src_lat_b[0] > src_lat_b[-1]:
+        lat_w = lat_w[:, ::-1]
+    if dst_lat_b[0] > dst_lat_b[-1]:
+        lat_w = lat_w[::-1]
+    src_lon_b, dst_lon_b = _bounds(src_lon), _bounds(dst_lon)
+    lon_w = sum(_overlap(src_lon_b, dst_lon_b + shift) for shift in (-360, 0, 360))
+    weights = scipy.sparse.kron(scipy.sparse.csr_matrix(lat_w), scipy.sparse.csr_matrix(lon_w), format='csr')
+    totals = np.asarray(weights.sum(axis=1)).ravel()
+    totals[totals == 0] = 1
+    return (scipy.sparse.diags(1 / totals) @ weights).tocsr()
+
+
+def _bracket(axis, points, periodic):
+    """Lower neighbour, upper neighbour and fraction of ``points`` on ``axis``"""
+    order = np.argsort(axis)
+    sorted_axis = np.asarray(axis, dtype=float)[order]
+    n = len(sorted_axis)
+    if periodic:
+        points = (points - sorted_axis[0]) % 360 + sorted_axis[0]
+        lower = np.searchsorted(sorted_axis, points, side='right') - 1
+        upper = (lower + 1) % n
+        width = (sorted_axis[upper] - sorted_axis[lower]) % 360
+        frac = (points - sorted_axis[lower]) / np.where(width == 0, 1, width)
+    else:
+        lower = np.clip(np.searchsorted(sorted_axis, points, side='right') - 1, 0, n - 2)
+        upper = lower + 1
+        frac = np.clip((points - sorted_axis[lower]) / (sorted_axis[upper] - sorted_axis[lower]), 0, 1)
+    return order[lower], order[upper], frac
+
+
+def bilinear_weights(src_lat, src_lon, dst_lat, dst_lon):
+    """Bilinear interpolation weights between rectilinear lat/lon grids
+
+    Longitude is periodic; destination latitudes beyond the source grid take the
+    edge row.
+
+    Returns:
+        scipy.sparse.csr_matrix: (dst lat*lon, src lat*lon) weights
+    """
+    nlon = len(src_lon)
+    lat0, lat1, t = _bracket(src_lat, np.asarray(dst_lat, dtype=float), periodic=False)
+    lon0, lon1, u = _bracket(src_lon, np.asarray(dst_lon, dtype=float), periodic=True)
+    # Broadcast to (dst lat, dst lon), four corners per destination cell
+    t, u = t[:, None], u[None, :]
+    corners = [
+        (lat0[:, None], lon0[None, :], (1 - t) * (1 - u)),
+        (lat0[:, None], lon1[None, :], (1 - t) * u),
+        (lat1[:, None], lon0[None, :], t * (1 - u)),
+        (lat1[:, None], lon1[None, :], t * u),
+    ]
+    shape = (len(dst_lat), len(dst_lon))
+    rows = np.tile(np.arange(shape[0] * shape[1]), 4)
+    cols = np.concatenate([np.broadcast_to(i * nlon + j, shape).ravel() for i, j, _ in corners])
+    vals = np.concatenate([np.broadcast_to(w, shape).ravel() for _, _, w in corners])
+    return scipy.sparse.csr_matrix((vals, (rows, cols)), shape=(shape[0] * shape[1], len(src_lat) * nlon))
+
+
+class Regridder:
+    """Sparse (dst, src) remap matrix between two lat/lon grids, cached on disk
+
+    Weights are computed once per (method, source grid, target grid) and stored as
+    .npz, so every model in the multi-model ensemble can be brought to one grid
+    and share its region masks, station index and cached reductions.
+    """
+
+    def __init__(self, src_lat, src_lon, dst_lat, dst_lon, method='bilinear', cache_dir=CACHE_DIR):
+        if method not in METHODS:
+            raise ValueError(f'Unknown regridding method: {method}')
+        self.src_lat, self.src_lon = np.asarray(src_lat), np.asarray(src_lon)
+        self.dst_lat, self.dst_lon = np.asarray(dst_lat), np.asarray(dst_lon)
+        self.method = method
+        key = f'{method}-{grid_fingerprint(src_lat, src_lon)}-{grid_fingerprint(dst_lat, dst_lon)}'
+        path = os.path.join(cache_dir, key + '.npz') if cache_dir else None
+        if path is not None and os.path.exists(path):
+            self.weights = scipy.sparse.load_npz(path).tocsr()
+            return
+        build = bilinear_weights if method == 'bilinear' else conservative_weights
+        self.weights = build(self.src_lat, self.src_lon, self.dst_lat, self.dst_lon)
+        if path is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            # Write then rename so concurrent workers never read a partial file
+            tmp = f'{path}.{os.getpid()}.tmp.npz'
+            scipy.sparse.save_npz(tmp, self.weights)
+            os.replace(tmp, path)
+
+    def _apply(self, block):
+        shape = block.shape[:-2]
+        flat = block.reshape(-1, block.shape[-2] * block.shape[-1])
+        valid = np.isfinite(flat)
+        # Renormalize around missing source cells (e.g. ocean-masked fields)
+        total = (self.weights @ np.where(valid, flat, 0).T).T
+        weight = (self.weights @ valid.T.astype(float)).T
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out = np.where(weight > 0, total / weight, np.nan)
+        return out.reshape(shape + (len(self.dst_lat), len(self.dst_lon)))
+
+    def __call__(self, data):
+        """Remap the lat/lon dimensions of ``data`` to the target grid
+
+        Args:
+            data (xarray DataArray or Dataset): data on the source grid, may be dask-backed
+
+        Returns:
+            xarray DataArray or Dataset: data on the target grid
+        """
+        np.testing.assert_allclose(data.lat.values, self.src_lat)
+        np.testing.assert_allclose(data.lon.values, self.src_lon)
+        if data.chunks:
+            data = data.chunk({'lat': -1, 'lon': -1})
+        result = xr.apply_ufunc(
+            self._apply,
+            data,
+            input_core_dims=[['lat', 'lon']],
+            output_core_dims=[['lat', 'lon']],
+            exclude_dims={'lat', 'lon'},
+            dask='parallelized',
+            output_dtypes=[float],
+            dask_gufunc_kwargs={'output_sizes': {'lat': len(self.dst_lat), 'lon': len(self.dst_lon)}},
+        )
+        return result.assign_coords(lat=self.dst_lat, lon=self.dst_lon)
+
+
+_regridders = OrderedDict()
+
+
+def regridder(src, dst, method='bilinear', maxsize=16):
+    """Memoized ``Regridder`` from the lat/lon of a source and a target dataset"""
+    key = (method, grid_fingerprint(src.lat, src.lon), grid_fingerprint(dst.lat, dst.lon))
+    if key not in _regridders:
+        _regridders[key] = Regridder(src.lat, src.lon, dst.lat, dst.lon, method=method)
+        while len(_regridders) > maxsize:
+            _regridders.popitem(last=False)
+    _regridders.move_to_end(key)
+    return _regridders[key]
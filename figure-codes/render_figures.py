@@ -0,0 +1,153 @@
+"""Render the full figure set headless
+
+Usage (from the repository root, so relative paths such as data/Control__Areas.geojson resolve):
+
+    python figure-codes/render_figures.py --data-dir /glade/u/home/valencig/wind-trend-analysis/data --processes 8
+
+Dask work inside the figures runs on the execution backend (see ``execution.py``):
+by default each worker process uses a threaded scheduler with its share of the
+CPUs; with ``--backend local`` or ``pbs`` (or WOC_BACKEND) one cluster is started
+and the figures are rendered one after another on it.
+"""
+import argparse
+import importlib
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+from glob import glob
+
+from execution import BACKENDS, Execution, ExecutionConfig
+
+# (output name, module, keyword arguments); module and function share a name
+FIGURES = [
+    ('climatology_near', 'fig_climatology', {'period': 'Near-term'}),
+    ('climatology_mid', 'fig_climatology', {'period': 'Mid-term'}),
+    ('climatology_far', 'fig_climatology', {'period': 'Far-term'}),
+    ('lineartrend', 'fig_lineartrend', {}),
+    ('lineartrend_members', 'fig_lineartrend_members', {}),
+    ('anomaly', 'fig_anomaly', {}),
+    ('anomaly_power_grid', 'fig_anomaly_power_grid', {}),
+    ('timeseries', 'fig_timeseries', {}),
+    ('cesm2le_anomaly', 'fig_cesm2le_anomaly', {}),
+    ('50yearmax_near', 'fig_50yearmax', {'forecast': 'near'}),
+    ('50yearmax_mid', 'fig_50yearmax', {'forecast': 'mid'}),
+    ('50yearmax_far', 'fig_50yearmax', {'forecast': 'far'}),
+    ('50yearmax_trend', 'fig_50yearmax_trend', {}),
+    ('historical_validation', 'fig_historical_validation', {}),
+]
+
+# Figures that read one file of the data directory instead of the cesm2 dictionary
+DATA_FILES = {'fig_historical_validation': 'hist_comp_zeng2019stations.csv'}
+
+
+def dataset_key(path):
+    """Key used by the figure functions for a preprocessed file
+
+    e.g. ScenarioMIP.NCAR.CESM2.ssp126.day.gn.anomaly.nc -> 'ssp126.anomaly' and
+    atm.ssp370.cam.h1.smbb.WSPDSRFMX.50yrWSPDSRFMX.nc -> 'h1.50yrWSPDSRFMX'
+    """
+    parts = os.path.basename(path).split('.')[:-1]
+    if 'h1' in parts:
+        return 'h1.' + parts[-1]
+    scenario = next((p for p in parts if re.fullmatch(r'ssp\d{3}', p)), parts[0])
+    return f'{scenario}.{parts[-1]}'
+
+
+def load_cesm2(data_dir):
+    """Lazily open every preprocessed file into the dictionary the figures consume"""
+    import xarray as xr
+
+    if glob(os.path.join(data_dir, '*.zarr')):
+        from intermediate_store import IntermediateStore
+        return IntermediateStore(data_dir).as_mapping()
+    cesm2 = dict()
+    for f in sorted(glob(os.path.join(data_dir, '*.nc'))):
+        cesm2[dataset_key(f)] = xr.open_dataset(f, chunks={})
+    return cesm2
+
+
+def _init_worker():
+    # Must happen before pyplot is imported anywhere in the worker
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def render(name, module, kwargs, data_dir, out_dir, dpi, execution=None):
+    """Render one figure in the current process and return (name, seconds)
+
+    Figure modules import cartopy, cf-xarray and nc-time-axis inside the figure
+    functions, so a worker only pays for the libraries of the figures it draws.
+
+    ``execution`` (an ExecutionConfig) sets the dask backend for the figure; None
+    keeps whatever scheduler is already active.
+    """
+    _init_worker()
+    import matplotlib.pyplot as plt
+
+    start = time.perf_counter()
+    func = getattr(importlib.import_module(module), module)
+    with Execution(execution) if execution is not None else nullcontext():
+        if module in DATA_FILES:
+            func(os.path.join(data_dir, DATA_FILES[module]), **kwargs)
+        else:
+            func(load_cesm2(data_dir), **kwargs)
+    plt.savefig(os.path.join(out_dir, f'{name}.png'), dpi=dpi, bbox_inches='tight', pad_inches=0.1)
+    plt.close('all')
+    return name, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render the figure-codes figures headless')
+    parser.add_argument('--data-dir', default='data', help='directory with the preprocessed NetCDF files or Zarr stores')
+    parser.add_argument('--out-dir', default='figures/report', help='output directory for the PNGs')
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--dpi', type=int, default=300)
+    parser.add_argument('--only', nargs='*', help='render only these figure names')
+    parser.add_argument('--backend', choices=BACKENDS, help='dask backend. Defaults to WOC_BACKEND or threads.')
+    parser.add_argument('--execution', help='JSON execution configuration (see execution.py)')
+    args = parser.parse_args(argv)
+
+    config = ExecutionConfig.from_file(args.execution) if args.execution else ExecutionConfig.from_env()
+    if args.backend:
+        config.backend = args.backend
+    elif config.backend == 'auto' and not args.execution and 'WOC_BACKEND' not in os.environ:
+        config.backend = 'threads'
+    figures = [f for f in FIGURES if not args.only or f[0] in args.only]
+    os.makedirs(args.out_dir, exist_ok=True)
+    failed = []
+
+    def report(name, result):
+        try:
+            _, seconds = result()
+            print(f'{name}: {seconds:.1f}s')
+        except Exception as e:
+            failed.append(name)
+            print(f'{name}: FAILED ({e!r})', file=sys.stderr)
+
+    if config.backend in ('threads', 'sync'):
+        # Split the CPUs between the render processes instead of oversubscribing them
+        if config.workers is None and config.backend == 'threads':
+            config.workers = max(os.cpu_count() // args.processes, 1)
+        with ProcessPoolExecutor(max_workers=args.processes, initializer=_init_worker) as pool:
+            futures = {
+                pool.submit(render, name, module, kwargs, args.data_dir, args.out_dir, args.dpi, config): name
+                for name, module, kwargs in figures
+            }
+            for future in as_completed(futures):
+                report(futures[future], future.result)
+    else:
+        # One cluster for the whole figure set; figures are drawn in this process,
+        # where the client is, one after another
+        with Execution(config):
+            for name, module, kwargs in figures:
+                report(name, lambda: render(name, module, kwargs, args.data_dir, args.out_dir, args.dpi))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    # Figure modules are imported by name, so make sure this directory is importable
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    sys.exit(main())
@@ -0,0 +1,184 @@
+import hashlib
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+from scipy.spatial import cKDTree
+
+from region_masks import grid_fingerprint
+
+logger = logging.getLogger('station_extract')
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'winds-of-change', 'station-index')
+
+
+def _unit_vectors(lat, lon):
+    # Points on the unit sphere so chord distance ranks like great-circle distance
+    lat, lon = np.deg2rad(lat), np.deg2rad(lon)
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def _stations_fingerprint(lat, lon):
+    h = hashlib.sha1()
+    h.update(np.ascontiguousarray(lat, dtype='float64').tobytes())
+    h.update(np.ascontiguousarray(lon, dtype='float64').tobytes())
+    return h.hexdigest()[:16]
+
+
+class StationIndex:
+    """Station lat/lon -> grid cell lookup for one model grid
+
+    'nearest' uses a spherical KD-tree over the grid cell centres; 'bilinear' uses
+    the four surrounding cells of a regular lat/lon grid. Indices are cached on
+    disk per (grid, station list), so each model grid is indexed once.
+    """
+
+    def __init__(self, lat_idx, lon_idx, weights, station_ids):
+        self.lat_idx = lat_idx  # (station, corner)
+        self.lon_idx = lon_idx
+        self.weights = weights
+        self.station_ids = np.asarray(station_ids)
+
+    @classmethod
+    def build(cls, grid_lat, grid_lon, station_lat, station_lon, station_ids=None, method='nearest', cache_dir=CACHE_DIR):
+        """Build (or load from cache) the index for a grid and a station list
+
+        Args:
+            grid_lat (array-like): model latitudes
+            grid_lon (array-like): model longitudes (0-360 or -180-180)
+            station_lat (array-like): station latitudes
+            station_lon (array-like): station longitudes
+            station_ids (array-like, optional): station identifiers. Defaults to 0..n-1.
+            method (str, optional): 'nearest' or 'bilinear'. Defaults to 'nearest'.
+            cache_dir (str, optional): cache directory, None to disable. Defaults to CACHE_DIR.
+
+        Returns:
+            StationIndex: the index
+        """
+        grid_lat, grid_lon = np.asarray(grid_lat, dtype=float), np.asarray(grid_lon, dtype=float)
+        station_lat, station_lon = np.asarray(station_lat, dtype=float), np.asarray(station_lon, dtype=float)
+        if station_ids is None:
+            station_ids = np.arange(len(station_lat))
+        key = f'{method}-{grid_fingerprint(grid_lat, grid_lon)}-{_stations_fingerprint(station_lat, station_lon)}'
+        path = os.path.join(cache_dir, key + '.npz') if cache_dir else None
+        if path is not None and os.path.exists(path):
+            cached = np.load(path)
+            return cls(cached['lat_idx'], cached['lon_idx'], cached['weights'], station_ids)
+        if method == 'nearest':
+            glon, glat = np.meshgrid(grid_lon, grid_lat)
+            tree = cKDTree(_unit_vectors(glat.ravel(), glon.ravel()))
+            _, cell = tree.query(_unit_vectors(station_lat, station_lon))
+            lat_idx, lon_idx = np.unravel_index(cell, glat.shape)
+            lat_idx, lon_idx = lat_idx[:, None], lon_idx[:, None]
+            weights = np.ones(lat_idx.shape)
+        elif method == 'bilinear':
+            lat_idx, lon_idx, weights = _bilinear(grid_lat, grid_lon, station_lat, station_lon)
+        else:
+            raise ValueError(f'Unknown station index method: {method}')
+        if path is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = f'{path}.{os.getpid()}.tmp.npz'
+            np.savez(tmp, lat_idx=lat_idx, lon_idx=lon_idx, weights=weights)
+            os.replace(tmp, path)
+        return cls(lat_idx, lon_idx, weights, station_ids)
+
+    def extract(self, data):
+        """All stations in one vectorized pointwise selection
+
+        Args:
+            data (xarray DataArray or Dataset): gridded data with lat/lon dimensions
+
+        Returns:
+            xarray DataArray or Dataset: data with (lat, lon) replaced by 'station'
+        """
+        dims = ('station', 'corner')
+        points = data.isel(
+            lat=xr.DataArray(self.lat_idx, dims=dims),
+            lon=xr.DataArray(self.lon_idx, dims=dims),
+        )
+        if self.weights.shape[1] == 1:
+            points = points.isel(corner=0, drop=True)
+        else:
+            # mean renormalizes the weights around NaN corners (e.g. masked ocean cells)
+            points = points.weighted(xr.DataArray(self.weights, dims=dims)).mean('corner')
+        return points.assign_coords(station=self.station_ids)
+
+
+def _bilinear(grid_lat, grid_lon, station_lat, station_lon):
+    # Work on a 0-360 longitude axis with periodic wrap
+    glon = np.mod(grid_lon, 360)
+    slon = np.mod(station_lon, 360)
+    order = np.argsort(glon)
+    sorted_lon = glon[order]
+    j1 = np.searchsorted(sorted_lon, slon) % len(sorted_lon)
+    j0 = (j1 - 1) % len(sorted_lon)
+    dlon = np.mod(sorted_lon[j1] - sorted_lon[j0], 360)
+    wx = np.where(dlon > 0, np.mod(slon - sorted_lon[j0], 360) / np.where(dlon > 0, dlon, 1), 0)
+    lat_order = np.argsort(grid_lat)
+    sorted_lat = grid_lat[lat_order]
+    i1 = np.clip(np.searchsorted(sorted_lat, station_lat), 1, len(sorted_lat) - 1)
+    i0 = i1 - 1
+    wy = np.clip((station_lat - sorted_lat[i0]) / (sorted_lat[i1] - sorted_lat[i0]), 0, 1)
+    lat_idx = np.stack([lat_order[i0], lat_order[i0], lat_order[i1], lat_order[i1]], axis=1)
+    lon_idx = np.stack([order[j0], order[j1], order[j0], order[j1]], axis=1)
+    weights = np.stack([(1 - wy) * (1 - wx), (1 - wy) * wx, wy * (1 - wx), wy * wx], axis=1)
+    return lat_idx, lon_idx, weights
+
+
+def extract_stations(data, stations, source, method='nearest', cache_dir=CACHE_DIR):
+    """Extract a station table for one model/member set in a single pass
+
+    Args:
+        data (xarray DataArray): yearly anomalies with lat/lon (and optionally member) dims
+        stations (pandas DataFrame): must have 'station', 'lat' and 'lon' columns
+        source (str): name of the data source, e.g. 'cmip6' or 'LENS2_smbb'
+        method (str, optional): 'nearest' or 'bilinear'. Defaults to 'nearest'.
+        cache_dir (str, optional): station index cache directory. Defaults to CACHE_DIR.
+
+    Returns:
+        pandas DataFrame: long table with a 'source' column and an 'anomaly' value column
+    """
+    index = StationIndex.build(
+        data.lat, data.lon, stations.lat.values, stations.lon.values,
+        station_ids=stations.station.values, method=method, cache_dir=cache_dir,
+    )
+    logger.info(f'Extracting {len(stations)} stations from {source}')
+    points = index.extract(data).compute()
+    df = points.rename('anomaly').to_dataframe().reset_index()
+    df['source'] = source
+    return df
+
+
+def write_station_table(df, path, partition_cols=('source',)):
+    """Write a station table as a partitioned parquet dataset
+
+    New sources land in their own partition, so adding a model never rewrites the others;
+    re-extracting a source replaces its partition instead of adding files next to it.
+
+    Args:
+        df (pandas DataFrame): long station table, e.g. from ``extract_stations``
+        path (str): dataset directory
+        partition_cols (tuple, optional): partition columns. Defaults to ('source',).
+    """
+    logger.info(f'Writing to dataset {path}')
+    df.to_parquet(path, partition_cols=list(partition_cols), index=False, existing_data_behavior='delete_matching')
+
+
+def read_station_table(path, index=('station', 'year')):
+    """Read a partitioned station dataset back in the wide '<source>_anomaly' layout
+
+    Args:
+        path (str): dataset directory
+        index (tuple, optional): columns identifying a row. Defaults to ('station', 'year').
+
+    Returns:
+        pandas DataFrame: one '<source>_anomaly' column per source
+    """
+    df = pd.read_parquet(path)
+    df['source'] = df['source'].astype(str)
+    # Members are averaged so every source has one value per station and year
+    wide = df.pivot_table(index=list(index), columns='source', values='anomaly', aggfunc='mean')
+    wide.columns = [f'{c}_anomaly' for c in wide.columns]
+    return wide.reset_index()
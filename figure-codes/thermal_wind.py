@@ -0,0 +1,142 @@
+import numpy as np
+import xarray as xr
+
+R = 287.052874  # Gas constant for dry air [J kg-1 K-1]
+a = 6_378_100  # Earth radius [m]
+OMEGA = 7.2921159e-5  # Earth rotation rate [s-1]
+
+# Pressure levels from Shaw and Miyakawa (2024), top to surface [hPa]
+PLEV = np.array([200, 230, 270, 320, 380, 445, 525, 610, 690, 760, 820, 860, 890, 910, 936, 960, 975, 990, 1000], dtype=float)
+
+# Percentiles stored with the jet data
+QUANTILES = np.linspace(0.1, 99.9, 101) / 100
+
+
+def coriolis(lat):
+    """Coriolis parameter for an array of latitudes (degrees), computed in one broadcast"""
+    return 2 * OMEGA * np.sin(np.deg2rad(np.asarray(lat, dtype=float)))
+
+
+def _interp_levels(T, p, plev):
+    """Linear interpolation of T(..., lev, lat) onto plev, lev increasing down
+
+    ``p`` is either the nominal 1-D column (lev,) or the full pressure (..., lev, lat).
+    """
+    nlev = T.shape[-2]
+    if p.ndim == 1:
+        # One column for every cell: a single searchsorted gives the bracketing levels
+        below = np.searchsorted(p, plev, side='left')  # levels with p < plev
+        upper = np.clip(below - 1, 0, nlev - 1)
+        lower = np.clip(below, 0, nlev - 1)
+        p0, p1 = p[upper][:, None], p[lower][:, None]
+        t0, t1 = T[..., upper, :], T[..., lower, :]
+        outside = ((below == 0) & (plev < p[0]) | (below == nlev))[:, None]
+    else:
+        # One target level at a time, so no (..., plev, lev, lat) comparison is built
+        below = np.stack([(p < level).sum(axis=-2) for level in plev], axis=-2)  # (..., plev, lat)
+        upper = np.clip(below - 1, 0, nlev - 1)
+        lower = np.clip(below, 0, nlev - 1)
+        p0 = np.take_along_axis(p, upper, axis=-2)
+        p1 = np.take_along_axis(p, lower, axis=-2)
+        t0 = np.take_along_axis(T, upper, axis=-2)
+        t1 = np.take_along_axis(T, lower, axis=-2)
+        outside = (below == 0) & (plev[:, None] < p[..., :1, :]) | (below == nlev)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        w = np.where(p1 > p0, (plev[:, None] - p0) / (p1 - p0), 0)
+    out = t0 + w * (t1 - t0)
+    # Targets outside the column are missing, as with xarray interp
+    return np.where(outside, np.nan, out)
+
+
+def _thermal_wind_kernel(T, p, lat, plev):
+    """Thermal wind from T(..., lev, lat) on source pressures p in one pass per block"""
+    Tp = _interp_levels(T, p, plev)
+    # Meridional temperature gradient per degree latitude, as in get_thermal_wind
+    grad = np.gradient(Tp, lat, axis=-1)
+    dp = np.diff(plev, prepend=plev[0])  # dp at the top level is 0
+    f = coriolis(lat)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weight = -(R / a) * dp[:, None] / (f[None, :] * plev[:, None])
+    return np.nansum(grad * weight, axis=-2)
+
+
+def _hybrid_kernel(T, ps, hyam, hybm, p0, lat, plev):
+    # Full-level pressure [hPa] built per block, never as a full-size array
+    p = (hyam[:, None] * p0 + hybm[:, None] * ps[..., None, :]) / 100
+    return _thermal_wind_kernel(T, p, lat, plev)
+
+
+def thermal_wind(ds, plev=PLEV):
+    """Zonal thermal wind integrated from 200 hPa to the surface
+
+    Vectorized replacement for ``get_thermal_wind``: the Coriolis parameter is
+    computed once per latitude, and interpolation to pressure levels plus the
+    vertical integration run as one kernel per dask block. If the dataset carries
+    hybrid coefficients (hyam, hybm, P0) and surface pressure PS the model-level
+    pressure is reconstructed per column, otherwise the nominal ``lev`` (hPa) is used.
+
+    Args:
+        ds (xarray dataset): daily 3D temperature 'T' on 'lev', optionally with PS, hyam, hybm, P0
+        plev (array-like, optional): target pressure levels [hPa]. Defaults to PLEV.
+
+    Returns:
+        xarray DataArray: zonal thermal wind 'ug' [m/s] without a 'lev' dimension
+    """
+    plev = np.asarray(plev, dtype=float)
+    T = ds['T']
+    if T.chunks:
+        T = T.chunk({'lev': -1, 'lat': -1})
+    lat = T.lat.values.astype(float)
+    common = dict(
+        input_core_dims=[['lev', 'lat']],
+        output_core_dims=[['lat']],
+        dask='parallelized',
+        output_dtypes=[float],
+    )
+    if all(v in ds for v in ('PS', 'hyam', 'hybm')):
+        p0 = float(ds['P0']) if 'P0' in ds else 100000.0
+        ps = ds['PS'].chunk({'lat': -1}) if ds['PS'].chunks else ds['PS']
+        ug = xr.apply_ufunc(
+            _hybrid_kernel, T, ps,
+            kwargs=dict(hyam=ds.hyam.values, hybm=ds.hybm.values, p0=p0, lat=lat, plev=plev),
+            input_core_dims=[['lev', 'lat'], ['lat']],
+            output_core_dims=[['lat']],
+            dask='parallelized',
+            output_dtypes=[float],
+        )
+    else:
+        ug = xr.apply_ufunc(
+            _thermal_wind_kernel, T,
+            kwargs=dict(p=T.lev.values.astype(float), lat=lat, plev=plev),
+            **common,
+        )
+    ug.name = 'ug'
+    ug.attrs = {'units': 'm/s', 'long_name': 'Zonal thermal wind'}
+    return ug
+
+
+def wind_percentiles(winds, q=QUANTILES, dims=('lon', 'time')):
+    """Per-latitude wind percentiles, named like the jet-data files ('<var>_percentiles')"""
+    winds = winds.chunk({d: -1 for d in dims}) if winds.chunks else winds
+    percentiles = winds.quantile(q, dim=list(dims))
+    return percentiles.rename({v: f'{v}_percentiles' for v in winds.data_vars})
+
+
+def write_jet_member(T, U200, TS, path, plev=PLEV, q=QUANTILES):
+    """Thermal wind, U200, their percentiles and mean TS written straight to disk
+
+    Nothing is pulled to the client first; dask workers compute and write the file.
+
+    Args:
+        T (xarray dataset): daily 3D temperature (optionally with PS and hybrid coefficients)
+        U200 (xarray DataArray): daily 200 hPa zonal wind
+        TS (xarray DataArray): daily surface temperature
+        path (str): output netCDF file, e.g. jet-data/jet-<sim>-<member>.nc
+        plev (array-like, optional): target pressure levels [hPa]. Defaults to PLEV.
+        q (array-like, optional): quantiles to store. Defaults to QUANTILES.
+    """
+    winds = xr.merge([thermal_wind(T, plev=plev), U200])
+    percentiles = wind_percentiles(winds, q=q)
+    surface_temp = TS.mean(['lat', 'lon'])
+    merged = xr.merge([winds, percentiles, surface_temp])
+    merged.to_netcdf(path)
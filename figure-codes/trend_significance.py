@@ -0,0 +1,120 @@
+import numpy as np
+import scipy.stats
+import xarray as xr
+
+
+def _trend_axis(da, dim):
+    """Numeric regressor for the trend dimension (fractional years for datetimes)"""
+    coord = da[dim]
+    if coord.dtype.kind in 'iuf':
+        return coord.astype(float)
+    # Datetime or cftime coordinates are converted to fractional years
+    return coord.dt.year + (coord.dt.dayofyear - 1) / 365.25
+
+
+def _t_sf(t, dof):
+    return scipy.stats.t.sf(t, df=dof)
+
+
+def linear_trend(da, dim='year', lag1=False, two_sided=False):
+    """Closed-form OLS trend and significance for every cell of an array
+
+    Replaces ``polyfit(..., cov=True)`` followed by a ``p_val`` call per lat/lon pair.
+    All other dimensions (member_id, realization, lat, lon, ...) are broadcast, so a
+    full (member, lat, lon) field is fitted in a single vectorized pass. Works lazily
+    on dask-backed arrays.
+
+    Args:
+        da (xarray DataArray): data to fit along ``dim``, NaNs are skipped
+        dim (str, optional): dimension to fit the trend along. Defaults to 'year'.
+        lag1 (bool, optional): Whether to adjust the sample size for lag-1 autocorrelation
+            of the residuals (Santer et al. 2000). Defaults to False.
+        two_sided (bool, optional): Whether to return a two-sided p-value. Defaults to False,
+            which matches the one-sided test of the old ``p_val``.
+
+    Returns:
+        xarray dataset: slope, intercept, stderr, tstat, pval, n_eff and dof for every cell
+    """
+    x = _trend_axis(da, dim)
+    valid = da.notnull()
+    # Regressor only counts where data exists
+    x = x.where(valid)
+    n = valid.sum(dim)
+    x_mean = x.sum(dim) / n
+    y_mean = da.sum(dim) / n
+    x_anom = x - x_mean
+    y_anom = da - y_mean
+    sxx = (x_anom ** 2).sum(dim)
+    sxy = (x_anom * y_anom).sum(dim)
+    slope = sxy / sxx
+    intercept = y_mean - slope * x_mean
+    # Residual variance with two fitted parameters
+    resid = y_anom - slope * x_anom
+    sse = (resid ** 2).sum(dim)
+    if lag1:
+        # Lag-1 autocorrelation of the residuals
+        r1 = (resid * resid.shift({dim: 1})).sum(dim) / sse
+        r1 = r1.clip(min=0, max=0.99)
+        n_eff = (n * (1 - r1) / (1 + r1)).clip(min=3)
+    else:
+        n_eff = n.astype(float)
+    dof = n_eff - 2
+    # Standard error inflated by the reduced degrees of freedom
+    stderr = np.sqrt(sse / dof / sxx)
+    tstat = slope / stderr
+    pval = xr.apply_ufunc(
+        _t_sf,
+        abs(tstat),
+        dof,
+        dask='parallelized',
+        output_dtypes=[float],
+    )
+    if two_sided:
+        pval = 2 * pval
+    return xr.Dataset(
+        dict(
+            slope=slope,
+            intercept=intercept,
+            stderr=stderr,
+            tstat=tstat,
+            pval=pval,
+            n_eff=n_eff,
+            dof=dof,
+        )
+    )
+
+
+def significance_mask(trend, alpha=0.05):
+    """Boolean mask of cells whose trend is significant at ``alpha``
+
+    Args:
+        trend (xarray dataset): output of ``linear_trend``
+        alpha (float, optional): significance level. Defaults to 0.05.
+
+    Returns:
+        xarray DataArray: True where the trend is significant
+    """
+    return trend.pval < alpha
+
+
+def add_stippling(ax, mask, transform=None, **kwargs):
+    """Stipple significant cells with a single scatter call
+
+    Args:
+        ax (matplotlib axes): axes to draw on
+        mask (xarray DataArray): 2D (lat, lon) boolean mask, e.g. from ``significance_mask``
+        transform (cartopy crs, optional): projection of the data. Defaults to None.
+        **kwargs: passed to ``ax.scatter`` (defaults to small black dots)
+
+    Returns:
+        matplotlib PathCollection: the scatter artist
+    """
+    mask = mask.transpose('lat', 'lon')
+    lon, lat = np.meshgrid(mask.lon.values, mask.lat.values)
+    keep = mask.values.astype(bool)
+    kwargs.setdefault('color', 'k')
+    kwargs.setdefault('marker', 'o')
+    kwargs.setdefault('s', 4)
+    if transform is not None:
+        kwargs['transform'] = transform
+    return ax.scatter(lon[keep], lat[keep], **kwargs)